@@ -0,0 +1,168 @@
+from scheduler import HostScheduler, SchedulerConfig
+from parse_executor import PARSE_BACKEND, PARSE_BACKENDS, ParseExecutor
+from storage import append_diary, is_valid_username, load_diary, save_diary
+from scrapper import _crawl_resources, crawl, sync
+from film_cache import FilmCache
+from time import perf_counter
+import argparse
+import asyncio
+import metrics
+import profiling
+import httpx
+import json
+import sys
+
+
+# Users crawled at the same time, their requests still share the scheduler limits of the host
+MAX_USERS_IN_FLIGHT = 4
+
+
+async def crawl_user(username: str, client: httpx.AsyncClient, cache: FilmCache, scheduler: HostScheduler,
+                     executor: ParseExecutor, incremental: bool = True) -> dict:
+    """ Crawl the diary of a user and store it, returning a report of the crawl.
+        A failing user is reported rather than raised, so that it does not stop the batch,
+        and a partially fetched diary is reported with its missing pages and films.
+    """
+    start = perf_counter()
+    report = {"username": username, "status": "ok", "entries": 0, "new_entries": 0, "error": None,
+              "missing_pages": [], "missing_films": []}
+
+    try:
+        stored = await asyncio.to_thread(load_diary, username) if incremental else None
+        if stored is None:
+            result = await crawl(username, None, cache, scheduler, client, executor)
+            df = result.df
+            if not result.complete:
+                # An incomplete diary is not stored, the next run resumes the crawl from its checkpoint
+                report.update(status="partial", entries=len(df), missing_pages=result.missing_pages,
+                              missing_films=result.missing_films,
+                              error=f"{len(result.missing_pages)} pages and {len(result.missing_films)} films missing")
+                report["time_s"] = round(perf_counter() - start, 3)
+                return report
+            if not df.empty:
+                await asyncio.to_thread(save_diary, username, df)
+            new_entries = len(df)
+        else:
+            df = await sync(username, stored, cache, scheduler, client, executor)
+            # sync puts the new entries first
+            new_entries = len(df) - len(stored)
+            missing_films = df.attrs.get("missing_films", [])
+            if missing_films:
+                # Not appended either: the next sync would stop on the entries stored after the missing ones
+                report.update(status="partial", entries=len(df), missing_films=missing_films,
+                              error=f"{len(missing_films)} films missing")
+                report["time_s"] = round(perf_counter() - start, 3)
+                return report
+            await asyncio.to_thread(append_diary, username, df.iloc[:new_entries])
+
+        report["entries"] = len(df)
+        report["new_entries"] = new_entries
+        if df.empty:
+            report["status"] = "empty"
+    except httpx.HTTPStatusError as e:
+        report["status"] = "not found" if e.response.status_code == 404 else "failed"
+        report["error"] = str(e)
+    except Exception as e:
+        report["status"] = "failed"
+        report["error"] = f"{type(e).__name__}: {e}"
+
+    report["time_s"] = round(perf_counter() - start, 3)
+    return report
+
+
+async def run_batch(usernames: list[str], max_users_in_flight: int = MAX_USERS_IN_FLIGHT,
+                    incremental: bool = True, cache: FilmCache | None = None,
+                    scheduler: HostScheduler | None = None, client: httpx.AsyncClient | None = None,
+                    executor: ParseExecutor | None = None) -> list[dict]:
+    """ Crawl the diaries of many users concurrently, under a single client, film cache,
+        scheduler and parse executor. Reports are returned in the order of the usernames.
+    """
+    # A user listed twice would have its diary written twice at the same time
+    usernames = list(dict.fromkeys(usernames))
+
+    async with _crawl_resources(client, cache, scheduler, executor) as (client, cache, scheduler, executor):
+        users_in_flight = asyncio.Semaphore(max_users_in_flight)
+
+        async def crawl_user_bounded(username: str) -> dict:
+            async with users_in_flight:
+                report = await crawl_user(username, client, cache, scheduler, executor, incremental)
+            print(f"{username}: {report['status']}, {report['new_entries']} new entries "
+                  f"in {report['time_s']}s", file=sys.stderr)
+            return report
+
+        return list(await asyncio.gather(*(crawl_user_bounded(username) for username in usernames)))
+
+
+def read_usernames(paths: list[str]) -> list[str]:
+    """ Read one username per line from each file ('-' for stdin), skipping blank lines and # comments """
+    usernames = []
+    for path in paths:
+        file = sys.stdin if path == "-" else open(path)
+        with file:
+            for line in file:
+                line = line.split("#", 1)[0].strip()
+                if line:
+                    usernames.append(line)
+    return usernames
+
+
+def print_reports(reports: list[dict], elapsed: float, as_json: bool = False) -> int:
+    """ Print the reports as a table or as JSON, and a summary on stderr. Return the number of failed users """
+    if as_json:
+        print(json.dumps(reports, indent=2))
+    else:
+        columns = ["username", "status", "entries", "new_entries", "time_s"]
+        print(" | ".join(f"{column:>14}" for column in columns))
+        for report in reports:
+            print(" | ".join(f"{report[column]:>14}" for column in columns))
+
+    failed = [report for report in reports if report["status"] in ("failed", "not found", "partial")]
+    for report in failed:
+        print(f"{report['username']}: {report['error']}", file=sys.stderr)
+    print(f"{len(reports)} users in {elapsed:.1f}s, {len(failed)} failed", file=sys.stderr)
+    return len(failed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Crawl the diaries of many letterboxd users and store them")
+    parser.add_argument("usernames", nargs="*")
+    parser.add_argument("--from-file", action="append", default=[], metavar="PATH",
+                        help="file with one username per line, '-' for stdin")
+    parser.add_argument("--max-users", type=int, default=MAX_USERS_IN_FLIGHT,
+                        help="number of users crawled at the same time")
+    parser.add_argument("--full", action="store_true",
+                        help="crawl the whole diaries instead of the entries logged since the last crawl")
+    parser.add_argument("--rate", type=float,
+                        help="maximum number of requests per second to letterboxd, shared by every user")
+    parser.add_argument("--parse-backend", default=PARSE_BACKEND, choices=PARSE_BACKENDS)
+    parser.add_argument("--json", action="store_true", help="print the reports as JSON")
+    parser.add_argument("--metrics", metavar="PATH",
+                        help="write the crawl metrics to PATH in the Prometheus text format")
+    parser.add_argument("--profile", metavar="DIR",
+                        help="profile the whole batch and write the profiles to DIR")
+    args = parser.parse_args()
+
+    usernames = args.usernames + read_usernames(args.from_file)
+    if not usernames:
+        parser.error("no usernames given")
+    invalid = [username for username in usernames if not is_valid_username(username)]
+    if invalid:
+        parser.error(f"invalid usernames: {', '.join(invalid)}")
+
+    scheduler_config = SchedulerConfig().capped(args.rate) if args.rate else SchedulerConfig()
+    scheduler = HostScheduler(scheduler_config)
+    executor = ParseExecutor(args.parse_backend)
+    capture = profiling.Capture("batch", args.profile).start() if args.profile else None
+    start = perf_counter()
+    reports = asyncio.run(run_batch(usernames, args.max_users, not args.full,
+                                    scheduler=scheduler, executor=executor))
+    elapsed = perf_counter() - start
+    if capture is not None:
+        print(f"Profiles written to {', '.join(capture.stop())}", file=sys.stderr)
+    executor.close()
+
+    if args.metrics:
+        metrics.write_text_file(args.metrics)
+    failed = print_reports(reports, elapsed, args.json)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,126 @@
+from replay_server import ReplayConfig, ReplayServer
+from recording import DEFAULT_FIXTURES_DIR
+from scheduler import HostScheduler, SchedulerConfig
+from parse_executor import PARSE_BACKEND, PARSE_BACKENDS, ParseExecutor
+from film_cache import FilmCache
+from time import perf_counter
+import multiprocessing
+import statistics
+import tempfile
+import resource
+import argparse
+import asyncio
+import httpx
+import json
+import os
+
+
+DIARY_SIZES = [1, 10, 100, 500]
+
+# The real scheduler limits protect letterboxd, the local replay does not need them
+UNTHROTTLED = SchedulerConfig(max_concurrency=64, max_pages_in_flight=8,
+                              initial_rate=10_000, max_rate=10_000, burst=10_000)
+
+
+def _percentile(values: list[float], q: float) -> float:
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100)[q - 1]
+
+
+async def _crawl(base_url: str, total_pages: int, scheduler_config: SchedulerConfig, parse_backend: str) -> dict:
+    # Imported here so that every benchmark process picks up its own BASE_URL
+    import scrapper
+    scrapper.BASE_URL = base_url
+
+    latencies = []
+
+    async def on_request(request: httpx.Request) -> None:
+        request.extensions["started_at"] = perf_counter()
+
+    async def on_response(response: httpx.Response) -> None:
+        latencies.append(perf_counter() - response.request.extensions["started_at"])
+
+    scheduler = HostScheduler(scheduler_config)
+    client = scrapper.make_client(scheduler, http_cache_dir=None)
+    client.event_hooks = {"request": [on_request], "response": [on_response]}
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = FilmCache(os.path.join(cache_dir, "films.sqlite3"))
+        executor = ParseExecutor(parse_backend)
+
+        start = perf_counter()
+        async with client:
+            df = await scrapper.main("bench", total_pages, cache, scheduler, client, executor)
+        elapsed = perf_counter() - start
+
+        cache.close()
+        executor.close()
+
+    return {
+        "parse_backend": parse_backend,
+        "pages": total_pages,
+        "entries": df.shape[0],
+        "requests": len(latencies),
+        "total_time_s": round(elapsed, 3),
+        "requests_per_s": round(len(latencies) / elapsed, 1),
+        "p50_latency_ms": round(_percentile(latencies, 50) * 1000, 1),
+        "p95_latency_ms": round(_percentile(latencies, 95) * 1000, 1),
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def _run_one(base_url: str, total_pages: int, scheduler_config: SchedulerConfig, parse_backend: str,
+             results) -> None:
+    results.put(asyncio.run(_crawl(base_url, total_pages, scheduler_config, parse_backend)))
+
+
+def run_benchmark(sizes: list[int], fixtures_dir: str = DEFAULT_FIXTURES_DIR,
+                  replay_config: ReplayConfig | None = None,
+                  scheduler_config: SchedulerConfig = UNTHROTTLED,
+                  parse_backend: str = PARSE_BACKEND) -> list[dict]:
+    """ Crawl a replayed diary of each size, each in its own process so that peak RSS is per crawl """
+    context = multiprocessing.get_context("spawn")
+    reports = []
+
+    with ReplayServer(fixtures_dir, replay_config) as server:
+        for total_pages in sizes:
+            results = context.Queue()
+            process = context.Process(target=_run_one,
+                                      args=(server.url, total_pages, scheduler_config, parse_backend, results))
+            process.start()
+            reports.append(results.get())
+            process.join()
+
+    return reports
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark scrapper.main against a local replay of letterboxd")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DIARY_SIZES,
+                        help="number of diary pages of each crawl")
+    parser.add_argument("--fixtures", default=DEFAULT_FIXTURES_DIR,
+                        help="recorded pages (see recording.py), synthetic pages are used if missing")
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--polite", action="store_true",
+                        help="use the scheduler limits of the app instead of an unthrottled crawl")
+    parser.add_argument("--parse-backend", default=PARSE_BACKEND, choices=PARSE_BACKENDS)
+    parser.add_argument("--json", action="store_true", help="print the reports as JSON")
+    args = parser.parse_args()
+
+    replay_config = ReplayConfig(args.latency, args.jitter, args.error_rate, args.throttle_rate)
+    scheduler_config = SchedulerConfig() if args.polite else UNTHROTTLED
+    reports = run_benchmark(args.sizes, args.fixtures, replay_config, scheduler_config, args.parse_backend)
+
+    if args.json:
+        print(json.dumps(reports, indent=2))
+    else:
+        columns = list(reports[0])
+        print(" | ".join(f"{column:>14}" for column in columns))
+        for report in reports:
+            print(" | ".join(f"{report[column]:>14}" for column in columns))
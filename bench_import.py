@@ -0,0 +1,86 @@
+import subprocess
+import argparse
+import sys
+import os
+
+
+# Modules imported by main.py when the app starts, before any chart is drawn
+APP_MODULES = ["streamlit", "runtime", "jobs", "stats", "figure_cache", "charts", "utils", "metrics", "profiling"]
+
+# Modules imported by streamlit itself (plotly among them), which the app cannot defer
+BASELINE_MODULES = ["streamlit"]
+
+# Plotting modules that the app itself must not import until a chart is drawn (see charts.py)
+LAZY_MODULES = ["matplotlib", "plotly", "seaborn", "mpl_toolkits", "visuals", "visuals_2"]
+
+# Cold start budget of the app modules, in milliseconds
+DEFAULT_BUDGET_MS = 2000
+
+
+def import_times(modules: list[str]) -> dict[str, tuple[int, int]]:
+    """ Self and cumulative import time in microseconds of every module imported by a fresh
+        interpreter importing modules, from the output of python -X importtime
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {', '.join(modules)}"],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {modules} failed:\n{result.stderr}")
+
+    times = {}
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def _fastest_run(modules: list[str], repeats: int) -> tuple[int, dict[str, tuple[int, int]]]:
+    runs = [import_times(modules) for _ in range(repeats)]
+    totals = [sum(self_us for self_us, _ in times.values()) for times in runs]
+    return min(totals), runs[totals.index(min(totals))]
+
+
+def run_benchmark(modules: list[str] = APP_MODULES, repeats: int = 5,
+                  baseline: list[str] = BASELINE_MODULES) -> dict:
+    """ Import the app modules in fresh interpreters, keeping the fastest run. Plotting modules are
+        only reported when the app imports them on top of the baseline modules
+    """
+    total_us, fastest = _fastest_run(modules, repeats)
+    baseline_us, baseline_times = _fastest_run(baseline, repeats)
+
+    return {
+        "total_ms": round(total_us / 1000, 1),
+        "baseline_ms": round(baseline_us / 1000, 1),
+        "slowest": sorted(((name, cumulative_us) for name, (_, cumulative_us) in fastest.items()
+                           if "." not in name), key=lambda item: -item[1])[:15],
+        "eager_plotting": sorted(name for name in fastest
+                                 if name.split(".")[0] in LAZY_MODULES and name not in baseline_times),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure the cold start imports of the app and check them against a budget")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    report = run_benchmark(APP_MODULES, args.repeats)
+    print(f"{'total_ms':>20}: {report['total_ms']} (budget {args.budget_ms})")
+    print(f"{'baseline_ms':>20}: {report['baseline_ms']} ({', '.join(BASELINE_MODULES)} alone)")
+    for name, cumulative_us in report["slowest"]:
+        print(f"{name:>20}: {cumulative_us / 1000:.1f} ms")
+
+    failed = False
+    if report["eager_plotting"]:
+        print(f"Plotting modules imported at start by the app: {', '.join(report['eager_plotting'][:10])}",
+              file=sys.stderr)
+        failed = True
+    if report["total_ms"] > args.budget_ms:
+        print(f"Cold start imports take {report['total_ms']} ms, over the {args.budget_ms} ms budget",
+              file=sys.stderr)
+        failed = True
+    sys.exit(1 if failed else 0)
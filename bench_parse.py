@@ -0,0 +1,112 @@
+from http_cache import DEFAULT_HTTP_CACHE_DIR, cached_pages
+from replay_server import synthetic_film_page
+from recording import DEFAULT_FIXTURES_DIR
+from scrapper import parse_film_details
+from selectolax.parser import HTMLParser
+from timeit import repeat
+import argparse
+import os
+
+
+def legacy_parse_film_details(content: str) -> dict:
+    """ parse_film_details as it was before the single-pass rewrite, kept as the baseline """
+    parser = HTMLParser(content)
+
+    country = parser.css_first("a[href*='/films/country/']").text(
+    ) if parser.css_first("a[href*='/films/country/']") else None
+    studio = parser.css_first(
+        "a[href*='/studio/']").text() if parser.css_first("a[href*='/studio/']") else None
+    primary_language = parser.css_first("a[href*='/films/language/']").text(
+    ) if parser.css_first("a[href*='/films/language/']") else None
+
+    genres = parser.css(
+        "a[href*='/films/genre/']") if parser.css("a[href*='/films/genre/']") else None
+    genres = [genre.text() for genre in genres] if genres else []
+
+    director = parser.css_first(
+        "a[href*='/director/']").text() if parser.css_first("a[href*='/director/']") else None
+
+    actors = parser.css("a[href*='/actor/']") if parser.css(
+        "a[href*='/actor/']") else None
+    actors = [actor.text() for actor in actors] if actors else []
+
+    running_time = parser.css_first("p[class*='text-link']").text() if parser.css_first(
+        "p[class*='text-link']") else None
+    running_time = [char for char in running_time.split()[0]
+                    if char.isdigit()] if running_time else None
+    running_time = int("".join(map(str, running_time))
+                       ) if running_time else None
+
+    # get "content" attribute value from meta tag whose name is "twitter:data2"
+    average_rating = parser.css_first(
+        "meta[name='twitter:data2']").attrs["content"] if parser.css_first("meta[name='twitter:data2']") else None
+    average_rating = float(average_rating.split(
+        " ")[0]) if average_rating else None
+    return {
+        "country": country,
+        "studio": studio,
+        "primary_language": primary_language,
+        "genres": genres,
+        "director": director,
+        "actors": actors,
+        "running_time": running_time,
+        "average_rating": average_rating
+    }
+
+
+def load_film_pages(fixtures_dir: str = DEFAULT_FIXTURES_DIR, http_cache_dir: str = DEFAULT_HTTP_CACHE_DIR,
+                    limit: int = 200) -> list[str]:
+    """ Saved film pages, from the fixtures then the HTTP cache, or synthetic ones if none was saved """
+    pages = []
+
+    film_dir = os.path.join(fixtures_dir, "film")
+    if os.path.isdir(film_dir):
+        for name in sorted(os.listdir(film_dir))[:limit]:
+            with open(os.path.join(film_dir, name), encoding="utf-8") as f:
+                pages.append(f.read())
+
+    if len(pages) < limit and os.path.isdir(http_cache_dir):
+        for url, content in cached_pages(http_cache_dir):
+            if "/film/" in url:
+                pages.append(content)
+            if len(pages) >= limit:
+                break
+
+    if not pages:
+        pages = [synthetic_film_page(f"film-{i}") for i in range(limit)]
+
+    return pages
+
+
+def run_benchmark(pages: list[str], number: int = 5, repeats: int = 5) -> dict:
+    """ Check that both parsers agree on every page, then time them over all the pages """
+    for content in pages:
+        assert parse_film_details(content) == legacy_parse_film_details(content)
+
+    def time_parser(parser) -> float:
+        timings = repeat(lambda: [parser(content) for content in pages], number=number, repeat=repeats)
+        return min(timings) / number / len(pages)
+
+    legacy = time_parser(legacy_parse_film_details)
+    current = time_parser(parse_film_details)
+
+    return {
+        "pages": len(pages),
+        "legacy_us_per_page": round(legacy * 1e6, 1),
+        "current_us_per_page": round(current * 1e6, 1),
+        "speedup": round(legacy / current, 2),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare parse_film_details with its previous implementation on saved film pages")
+    parser.add_argument("--fixtures", default=DEFAULT_FIXTURES_DIR)
+    parser.add_argument("--http-cache", default=DEFAULT_HTTP_CACHE_DIR)
+    parser.add_argument("--limit", type=int, default=200, help="maximum number of film pages")
+    parser.add_argument("--number", type=int, default=5)
+    args = parser.parse_args()
+
+    pages = load_film_pages(args.fixtures, args.http_cache, args.limit)
+    for name, value in run_benchmark(pages, args.number).items():
+        print(f"{name:>20}: {value}")
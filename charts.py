@@ -0,0 +1,27 @@
+from importlib import import_module
+from typing import Any, Callable
+from stats import ProfileStats
+
+
+# Module drawing each chart of the dashboard. Matplotlib and seaborn are heavy to import and, unlike plotly
+# which streamlit imports itself, only needed by the charts: a module is imported when one of its charts
+# is first drawn, not when the app starts.
+CHART_MODULES = {
+    "draw_top3": "visuals",
+    "draw_top_countries": "visuals",
+    "draw_log_timeline": "visuals",
+    "draw_top_genres": "visuals",
+    "draw_rating_dist": "visuals",
+    "draw_top_actors": "visuals",
+    "draw_studios_radar": "visuals_2",
+    "draw_decades_radar": "visuals_2",
+    "draw_lang_sankey": "visuals_2",
+}
+
+# Charts drawn from the diary pages alone, the others wait for the film details
+DIARY_CHARTS = {"draw_log_timeline", "draw_rating_dist", "draw_decades_radar"}
+
+
+def get_chart(name: str) -> Callable[[ProfileStats], Any]:
+    """ Draw function of a chart, importing its module on first use """
+    return getattr(import_module(CHART_MODULES[name]), name)
@@ -0,0 +1,92 @@
+from collections import OrderedDict
+from typing import Any, Callable
+from stats import ProfileStats
+import threading
+import metrics
+import io
+
+
+# Memory budget of the rendered charts, shared by every session of the app process
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# Same rendering options as st.pyplot
+PNG_OPTIONS = {"bbox_inches": "tight", "dpi": 200, "format": "png"}
+
+
+def render_figure(fig: Any) -> Any:
+    """ Render a figure to what is sent to the browser: PNG bytes for matplotlib and JSON for plotly.
+        Matplotlib figures are closed once rendered, anything else is returned unchanged.
+    """
+    # Imported here rather than with the module, the chart that drew fig has imported them already
+    import plotly.graph_objects as go
+    import matplotlib.pyplot as plt
+
+    if isinstance(fig, plt.Figure):
+        image = io.BytesIO()
+        try:
+            fig.savefig(image, **PNG_OPTIONS)
+        finally:
+            plt.close(fig)
+        return image.getvalue()
+
+    if isinstance(fig, go.Figure):
+        return fig.to_json()
+
+    return fig
+
+
+def _size(value: Any) -> int:
+    if isinstance(value, (bytes, str)):
+        return len(value)
+    if isinstance(value, tuple):
+        return sum(_size(item) for item in value)
+    return 0
+
+
+class FigureCache:
+    """ Charts rendered once per dataset version and reused across reruns and sessions.
+
+        Entries are keyed by chart and dataset key (see stats.dataset_key), and the least recently
+        used ones are evicted past max_bytes of rendered charts.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: OrderedDict[tuple[str, str], Any] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, draw: Callable[[ProfileStats], Any], stats: ProfileStats) -> Any:
+        """ Rendered result of draw(stats), the figures of a (fig, title, subtitle) result being rendered too """
+        key = (draw.__name__, stats.key)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+
+        # Rendered outside of the lock, two sessions drawing the same chart at once only waste a render
+        with metrics.draw_seconds.time(chart=draw.__name__):
+            result = draw(stats)
+        with metrics.render_seconds.time(chart=draw.__name__):
+            if isinstance(result, tuple):
+                rendered = tuple(render_figure(item) for item in result)
+            else:
+                rendered = render_figure(result)
+
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = rendered
+                self.size += _size(rendered)
+            self._evict()
+        return rendered
+
+    def _evict(self) -> None:
+        # The entry just added is kept even if it alone exceeds the budget
+        while self.size > self.max_bytes and len(self._entries) > 1:
+            _, rendered = self._entries.popitem(last=False)
+            self.size -= _size(rendered)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
@@ -0,0 +1,107 @@
+from time import time
+import threading
+import logging
+import sqlite3
+import json
+import os
+
+
+DEFAULT_CACHE_PATH = os.environ.get(
+    "LETTERBOARD_FILM_CACHE", os.path.join(".cache", "films.sqlite3"))
+
+# Fields returned by parse_film_details, grouped by how often they change on letterboxd.
+# Each group is stored with its own timestamp and expires after its own TTL (in seconds).
+FIELD_GROUPS = {
+    "credits": (["country", "studio", "primary_language", "genres", "director", "actors", "running_time"],
+                60 * 60 * 24 * 90),
+    "ratings": (["average_rating"], 60 * 60 * 24),
+}
+
+logger = logging.getLogger(__name__)
+
+
+def film_slug(film_url: str) -> str:
+    """ Return the film slug from a diary url, e.g. '/film/alien-romulus/' -> 'alien-romulus' """
+    return film_url.strip("/").split("/")[-1]
+
+
+class FilmCache:
+    """ Persistent SQLite store of parsed film details, keyed by film slug.
+
+        A film is only served from the cache if every field group is still fresh,
+        otherwise the film page has to be fetched again (it contains all the fields anyway).
+        Its methods block on the database: call them off the event loop. A database error
+        (e.g. "database is locked") is logged and the film treated as not cached, the cache
+        never failing a crawl.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, field_groups: dict = FIELD_GROUPS):
+        self.path = path
+        self.field_groups = field_groups
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS film_details ("
+            " slug TEXT NOT NULL,"
+            " field_group TEXT NOT NULL,"
+            " data TEXT NOT NULL,"
+            " fetched_at REAL NOT NULL,"
+            " PRIMARY KEY (slug, field_group))"
+        )
+        self._conn.commit()
+
+    def get(self, film_url: str) -> dict | None:
+        """ Return the cached details of a film, or None if missing or any field group is stale """
+        try:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT field_group, data, fetched_at FROM film_details WHERE slug = ?",
+                    (film_slug(film_url),)
+                ).fetchall()
+        except sqlite3.Error as e:
+            logger.warning("Reading %s from the film cache failed: %s", film_url, e)
+            return None
+
+        groups = {group: (data, fetched_at) for group, data, fetched_at in rows}
+        now = time()
+
+        details = {}
+        for group, (fields, ttl) in self.field_groups.items():
+            if group not in groups:
+                return None
+            data, fetched_at = groups[group]
+            if now - fetched_at > ttl:
+                return None
+            details.update(json.loads(data))
+
+        return details
+
+    def set(self, film_url: str, details: dict) -> None:
+        """ Store the parsed details of a film, one row per field group """
+        slug = film_slug(film_url)
+        now = time()
+
+        rows = [
+            (slug, group, json.dumps({field: details.get(field) for field in fields}), now)
+            for group, (fields, _) in self.field_groups.items()
+        ]
+
+        with self._lock:
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO film_details (slug, field_group, data, fetched_at) VALUES (?, ?, ?, ?)",
+                    rows
+                )
+                self._conn.commit()
+            except sqlite3.Error as e:
+                self._conn.rollback()
+                logger.warning("Storing %s in the film cache failed: %s", film_url, e)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,173 @@
+from typing import Callable, Iterator
+from time import time
+from uuid import uuid4
+import hashlib
+import asyncio
+import httpx
+import json
+import gzip
+import zlib
+import os
+
+
+DEFAULT_HTTP_CACHE_DIR = os.environ.get(
+    "LETTERBOARD_HTTP_CACHE", os.path.join(".cache", "http"))
+
+# Budget of the stored responses, the least recently stored ones are evicted past it
+DEFAULT_MAX_BYTES = int(os.environ.get("LETTERBOARD_HTTP_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+
+# Responses stored between two checks of the budget
+PRUNE_EVERY = 200
+
+# Headers describing the encoding of the stored body, which is stored decoded
+_ENCODING_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+
+
+def default_max_age(url: httpx.URL) -> float:
+    """ Number of seconds a cached response of url is served without revalidation.
+        Always revalidated (ETag / 304): every diary page shifts when new entries are logged.
+    """
+    return 0
+
+
+class CachingTransport(httpx.AsyncBaseTransport):
+    """ Transport storing GET responses on disk (gzip compressed) and revalidating them
+        with If-None-Match / If-Modified-Since, a 304 being answered from the stored copy.
+
+        It sits above the scheduling transport (see scheduler.SchedulingTransport), so that responses
+        served from disk never wait for a connection slot or a rate token. The stored responses are
+        kept under max_bytes, the least recently stored ones being evicted first.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, cache_dir: str = DEFAULT_HTTP_CACHE_DIR,
+                 max_age: Callable[[httpx.URL], float] = default_max_age, max_bytes: int = DEFAULT_MAX_BYTES):
+        self._transport = transport
+        self.cache_dir = cache_dir
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self._stores = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, url: httpx.URL) -> str:
+        key = hashlib.sha1(str(url).encode()).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def _load(self, path: str) -> tuple[dict, bytes] | None:
+        try:
+            with open(f"{path}.json") as f:
+                meta = json.load(f)
+            with gzip.open(f"{path}.gz") as f:
+                body = f.read()
+        except (OSError, ValueError, EOFError, zlib.error):
+            # Missing, or truncated by a writer that crashed: fetched again
+            return None
+        return meta, body
+
+    def _store(self, path: str, meta: dict, body: bytes | None = None) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to temporary files first so that readers never see a partial entry. They are named
+        # uniquely, as the worker processes of a sharded crawl may store the same response at once
+        temp = f"{path}.{uuid4().hex}"
+        if body is not None:
+            with gzip.open(f"{temp}.gz.tmp", "wb") as f:
+                f.write(body)
+            os.replace(f"{temp}.gz.tmp", f"{path}.gz")
+        with open(f"{temp}.json.tmp", "w") as f:
+            json.dump(meta, f)
+        os.replace(f"{temp}.json.tmp", f"{path}.json")
+
+    def prune(self) -> None:
+        """ Evict the least recently stored responses until the cache fits in max_bytes """
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name[:-len(".json")])
+                try:
+                    size = os.path.getsize(f"{path}.json") + os.path.getsize(f"{path}.gz")
+                    entries.append((os.path.getmtime(f"{path}.json"), size, path))
+                except OSError:
+                    continue
+                total += size
+
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            for suffix in (".json", ".gz"):
+                try:
+                    os.remove(f"{path}{suffix}")
+                except OSError:
+                    pass
+            total -= size
+
+    def _cached_response(self, request: httpx.Request, meta: dict, body: bytes) -> httpx.Response:
+        return httpx.Response(meta["status_code"], headers=meta["headers"], content=body,
+                              request=request, extensions={"from_cache": True})
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if request.method != "GET":
+            return await self._transport.handle_async_request(request)
+
+        path = self._path(request.url)
+        cached = await asyncio.to_thread(self._load, path)
+
+        if cached is not None:
+            meta, body = cached
+            if time() - meta["stored_at"] < self.max_age(request.url):
+                return self._cached_response(request, meta, body)
+
+            headers = {name.lower(): value for name, value in meta["headers"]}
+            if "etag" in headers:
+                request.headers["If-None-Match"] = headers["etag"]
+            if "last-modified" in headers:
+                request.headers["If-Modified-Since"] = headers["last-modified"]
+
+        response = await self._transport.handle_async_request(request)
+
+        if response.status_code == 304 and cached is not None:
+            await response.aclose()
+            meta["stored_at"] = time()
+            await asyncio.to_thread(self._store, path, meta)
+            return self._cached_response(request, meta, body)
+
+        if response.status_code != 200:
+            return response
+
+        # Transport level responses are not decoded yet: decode them before storing
+        body = await httpx.Response(response.status_code, headers=response.headers,
+                                    stream=response.stream).aread()
+
+        meta = {
+            "url": str(request.url),
+            "status_code": response.status_code,
+            "headers": [(name, value) for name, value in response.headers.multi_items()
+                        if name.lower() not in _ENCODING_HEADERS],
+            "stored_at": time(),
+        }
+        await asyncio.to_thread(self._store, path, meta, body)
+
+        self._stores += 1
+        if self._stores % PRUNE_EVERY == 0:
+            await asyncio.to_thread(self.prune)
+
+        return httpx.Response(response.status_code, headers=meta["headers"], content=body,
+                              request=request, extensions=response.extensions)
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+def cached_pages(cache_dir: str = DEFAULT_HTTP_CACHE_DIR) -> Iterator[tuple[str, str]]:
+    """ Iterate over the (url, html) pairs stored in the cache, e.g. to replay the parsers offline """
+    for root, _, files in os.walk(cache_dir):
+        for name in files:
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(root, name[:-len(".json")])
+            with open(f"{path}.json") as f:
+                meta = json.load(f)
+            with gzip.open(f"{path}.gz") as f:
+                yield meta["url"], f.read().decode()
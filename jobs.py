@@ -0,0 +1,192 @@
+from concurrent.futures import Future
+from contextlib import nullcontext
+from scrapper import enrich_stream, stream_main, sync
+from storage import append_diary, load_diary, save_diary
+from schema import apply_schema
+from runtime import CrawlRuntime
+from time import monotonic
+import profiling
+import pandas as pd
+import threading
+import asyncio
+
+
+# Crawls running at the same time, the next submitted ones wait for a free slot
+MAX_RUNNING_JOBS = 4
+
+# A job nobody polled for this long (every tab following it was closed) is cancelled, in seconds
+ABANDON_AFTER = 60.0
+
+# Finished jobs kept so that a late poll still finds their result, in seconds
+KEEP_FINISHED = 300.0
+
+
+class CrawlJob:
+    """ Crawl of the diary of a user running in the background, and storing it once fetched.
+
+        A full crawl has two phases: the diary pages alone ("diary"), then the film details of
+        their entries ("details"). Pages and enriched entries are collected as they arrive, so that
+        the page polling the job can show the diary before its film details are fetched.
+
+        Entries whose film failed to fetch are left out of df and listed in missing_films: such an
+        incomplete diary is not stored, so that the next fetch crawls them again.
+    """
+
+    def __init__(self, username: str, incremental: bool):
+        self.username = username
+        self.incremental = incremental
+        self.status = "queued"          # queued, running, done, failed or cancelled
+        self.phase = "diary"            # diary or details
+        self.done_pages = 0
+        self.total_pages: int | None = None
+        self.diary_df: pd.DataFrame | None = None
+        self.done_entries = 0
+        self.df: pd.DataFrame | None = None
+        self.missing_films: list[str] = []
+        self.error: BaseException | None = None
+        self.finished_at: float | None = None
+        self.last_polled = monotonic()
+        self.future: Future | None = None
+
+        self._pages: dict[int, pd.DataFrame] = {}
+        self._enriched: list[pd.DataFrame] = []
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed", "cancelled")
+
+    def poll(self) -> "CrawlJob":
+        """ Mark the job as still followed by a page """
+        self.last_polled = monotonic()
+        return self
+
+    def partial_df(self) -> pd.DataFrame | None:
+        """ Pages fetched so far, in diary order, or None before the first one """
+        with self._lock:
+            if not self._pages:
+                return None
+            return pd.concat([self._pages[page] for page in sorted(self._pages)], ignore_index=True)
+
+    def enriched_df(self) -> pd.DataFrame | None:
+        """ Entries with their film details so far, in diary order, or None before the first ones """
+        with self._lock:
+            if not self._enriched:
+                return None
+            return pd.concat(self._enriched, ignore_index=True)
+
+    def _add_page(self, page: int, df: pd.DataFrame, done: int, total: int) -> None:
+        with self._lock:
+            self._pages[page] = df
+            self.done_pages = done
+            self.total_pages = total
+
+    def _start_details(self, diary_df: pd.DataFrame) -> None:
+        self.diary_df = diary_df
+        self.phase = "details"
+
+    def _add_details(self, df: pd.DataFrame, done: int, missing_films: list[str]) -> None:
+        with self._lock:
+            self._enriched.append(df)
+            self.done_entries = done
+            self.missing_films += missing_films
+
+
+class JobManager:
+    """ Background crawls shared by every session of the app process, at most max_running at once.
+
+        Jobs run in the loop of the crawl runtime. A username has at most one active job:
+        submitting it again attaches to the running one instead of crawling the diary twice.
+    """
+
+    def __init__(self, runtime: CrawlRuntime, max_running: int = MAX_RUNNING_JOBS,
+                 abandon_after: float = ABANDON_AFTER):
+        self.runtime = runtime
+        self.abandon_after = abandon_after
+        self._slots = asyncio.Semaphore(max_running)
+        self._jobs: dict[str, CrawlJob] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, username: str, incremental: bool = True) -> CrawlJob:
+        """ Start a crawl of the diary of username, or return the one already running for it """
+        key = username.lower()
+        with self._lock:
+            self._forget_finished()
+            job = self._jobs.get(key)
+            if job is not None and not job.finished:
+                return job.poll()
+
+            job = self._jobs[key] = CrawlJob(username, incremental)
+            job.future = asyncio.run_coroutine_threadsafe(self._run(job), self.runtime.loop)
+            return job
+
+    def get(self, username: str) -> CrawlJob | None:
+        with self._lock:
+            job = self._jobs.get(username.lower())
+        return job.poll() if job is not None else None
+
+    def _forget_finished(self) -> None:
+        now = monotonic()
+        for key in [key for key, job in self._jobs.items()
+                    if job.finished and now - job.finished_at > KEEP_FINISHED]:
+            del self._jobs[key]
+
+    async def _run(self, job: CrawlJob) -> None:
+        try:
+            async with self._slots:
+                job.status = "running"
+                crawl = asyncio.create_task(self._crawl(job))
+                while not crawl.done():
+                    await asyncio.wait({crawl}, timeout=self.abandon_after / 4)
+                    if not crawl.done() and monotonic() - job.last_polled > self.abandon_after:
+                        crawl.cancel()
+                job.df = await crawl
+            status = "done"
+        except asyncio.CancelledError:
+            status = "cancelled"
+        except Exception as e:
+            job.error = e
+            status = "failed"
+        # Set before the status: a finished job is expected to have it (see _forget_finished)
+        job.finished_at = monotonic()
+        job.status = status
+
+    async def _crawl(self, job: CrawlJob) -> pd.DataFrame:
+        # The capture covers the runtime loop thread, other crawls running at the same time included
+        name = f"crawl-{profiling.safe_name(job.username)}"
+        with profiling.Capture(name) if profiling.PROFILE else nullcontext():
+            return await self._crawl_and_store(job)
+
+    async def _crawl_and_store(self, job: CrawlJob) -> pd.DataFrame:
+        runtime = self.runtime
+        stored = await asyncio.to_thread(load_diary, job.username) if job.incremental else None
+
+        if stored is None:
+            # The diary pages first, without the film details, so that they can be shown right away
+            crawl = stream_main(job.username, cache=runtime.cache, scheduler=runtime.scheduler,
+                                client=runtime.client, executor=runtime.executor, film_details=False)
+            async for result in crawl:
+                job._add_page(result.page, result.df, result.done, result.total)
+            diary_df = apply_schema(job.partial_df())
+            job._start_details(diary_df)
+
+            # Then the film details, a crawl that failed or was cancelled resuming from the film cache
+            enrich = enrich_stream(diary_df, runtime.cache, runtime.scheduler, runtime.client, runtime.executor)
+            async for result in enrich:
+                job._add_details(result.df, result.done, result.missing_films)
+
+            enriched_df = job.enriched_df()
+            df = apply_schema(enriched_df) if enriched_df is not None else diary_df
+            # The films fetched so far are in the film cache, the next fetch only requests the missing ones
+            if not df.empty and not job.missing_films:
+                await asyncio.to_thread(save_diary, job.username, df)
+        else:
+            df = await sync(job.username, stored, runtime.cache, runtime.scheduler,
+                            runtime.client, runtime.executor)
+            job.missing_films = df.attrs.get("missing_films", [])
+            # sync puts the new entries first. Without the missing ones, the next sync would stop
+            # on the entries stored after them and never fetch them again
+            if not job.missing_films:
+                await asyncio.to_thread(append_diary, job.username, df.iloc[:len(df) - len(stored)])
+
+        return df
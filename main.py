@@ -1,15 +1,28 @@
-import asyncio
 import httpx
 import streamlit as st
-from scrapper import get_total_pages, main
-from visuals import *
-from visuals_2 import *
+import plotly.io as pio
+from runtime import CrawlRuntime
+from jobs import CrawlJob, JobManager
+from stats import ProfileStats, compute_profile_stats, dataset_key
+from figure_cache import FigureCache
+from storage import is_valid_username
+import metrics
+import profiling
+from charts import DIARY_CHARTS, get_chart
 
-from utils import compute_df_by_filter
+from utils import FILTER_COLUMNS, compute_df_by_filter
 import pandas as pd
 
 st.set_page_config(layout="wide")  # Set the page layout to wide mode
 
+# Opt-in profiling of the render: LETTERBOARD_PROFILE, or ?profile=<LETTERBOARD_PROFILE_TOKEN> for a single one.
+# A rerun interrupts the script before its end, the capture it left running is written first.
+leftover_capture = st.session_state.pop("profile_capture", None)
+if leftover_capture is not None:
+    leftover_capture.stop()
+profile_requested = profiling.PROFILE_TOKEN is not None and st.query_params.get("profile") == profiling.PROFILE_TOKEN
+st.session_state.profile_capture = profiling.capture("render", profiling.PROFILE or profile_requested)
+
 st.title("Letterboard : Your Letterboxd Diary Analysis")
 
 st.markdown(
@@ -28,43 +41,185 @@ if 'username' not in st.session_state:
     st.session_state.username = None
 if 'df' not in st.session_state:
     st.session_state.df = None
+if 'stats' not in st.session_state:
+    st.session_state.stats = None
 if 'selected_column' not in st.session_state:
     st.session_state.selected_column = "Country"
 if 'active_tab' not in st.session_state:
     st.session_state.active_tab = "Level.1"
+if 'job_username' not in st.session_state:
+    st.session_state.job_username = None  # username of the background crawl the session follows
+if 'finished_job' not in st.session_state:
+    st.session_state.finished_job = None
+if 'diary_shown' not in st.session_state:
+    st.session_state.diary_shown = False  # the diary of the followed crawl is shown without its film details
 
 username = st.text_input("Enter your Letterboxd username:",
                          value=st.session_state.username or "").strip()
 
-if username and username != st.session_state.username:
+if username and not is_valid_username(username):
+    st.error(f"'{username}' is not a valid Letterboxd username: only letters, digits and underscores are allowed.")
+    # Otherwise Fetch Diary would crawl the previous username
+    st.session_state.username = None
+elif username and username != st.session_state.username:
     st.session_state.username = username
 
+
+
+@st.cache_resource
+def get_runtime() -> CrawlRuntime:
+    """ Crawl runtime shared by every session of the app process """
+    return CrawlRuntime()
+
+
+@st.cache_resource
+def start_metrics_server():
+    """ Prometheus endpoint of the app process, started once if LETTERBOARD_METRICS_PORT is set """
+    if metrics.METRICS_PORT:
+        return metrics.serve(int(metrics.METRICS_PORT))
+
+
+start_metrics_server()
+
+
+@st.cache_resource
+def get_job_manager() -> JobManager:
+    """ Background crawls shared by every session of the app process """
+    return JobManager(get_runtime())
+
+
+def show_partial_results(job: CrawlJob) -> None:
+    """ Progress of a running crawl and a preview of the charts on the pages fetched so far """
+    if job.total_pages is None:
+        st.progress(0.0, text="Fetching data...")
+        return
+    st.progress(job.done_pages / job.total_pages,
+                text=f"Fetched {job.done_pages} of {job.total_pages} pages")
+
+    partial_df = job.partial_df()
+    if partial_df is None or partial_df.empty:
+        return
+
+    partial_stats = compute_profile_stats(partial_df, dataset_key(job.username, partial_df))
+    col1, col2 = st.columns(2)
+    with col1:
+        st.plotly_chart(get_chart("draw_log_timeline")(partial_stats), key="preview_timeline")
+    with col2:
+        st.plotly_chart(get_chart("draw_rating_dist")(partial_stats), key="preview_ratings")
+
+
+@st.fragment(run_every=1.0)
+def follow_job() -> None:
+    """ Poll the crawl of the session, only this fragment reruns until the crawl finishes """
+    job = get_job_manager().get(st.session_state.job_username)
+    if job is None:
+        st.session_state.job_username = None
+        st.rerun()
+
+    if not job.finished:
+        if job.status == "queued":
+            st.info("Waiting for other crawls to finish...")
+        elif job.phase == "details":
+            if not st.session_state.diary_shown:
+                # The diary pages are in: the whole page reruns to show the charts they are enough for
+                st.session_state.diary_shown = True
+                st.session_state.df = job.diary_df
+                st.session_state.stats = compute_profile_stats(
+                    job.diary_df, dataset_key(job.username, job.diary_df))
+                st.rerun()
+            total = len(job.diary_df)
+            st.progress(job.done_entries / total if total else 1.0,
+                        text=f"Fetched the details of {job.done_entries} of {total} films")
+        elif job.incremental and job.total_pages is None:
+            st.info("Fetching new entries...")
+        else:
+            show_partial_results(job)
+        return
+
+    # The crawl is over: the whole page reruns to show its result
+    st.session_state.job_username = None
+    st.session_state.finished_job = job
+    st.rerun()
+
+
+@st.cache_resource
+def get_figure_cache() -> FigureCache:
+    """ Rendered charts shared by every session of the app process """
+    return FigureCache()
+
+
+def show_chart(name: str, stats: ProfileStats):
+    """ Display a chart rendered once per dataset version, under its title if it has one """
+    if not stats.has_film_details and name not in DIARY_CHARTS:
+        st.info("Fetching the film details...")
+        return
+
+    rendered = get_figure_cache().get(get_chart(name), stats)
+    chart, *titles = rendered if isinstance(rendered, tuple) else (rendered,)
+
+    if titles:
+        title, subtitle = titles
+        st.markdown(f"""
+        # {title}
+        {subtitle}
+        """)
+
+    if isinstance(chart, bytes):
+        st.image(chart, use_column_width=True)
+    else:
+        st.plotly_chart(pio.from_json(chart))
+
+
+if st.sidebar.checkbox("Show performance metrics"):
+    st.sidebar.dataframe(pd.DataFrame(metrics.summary()), hide_index=True)
+
+incremental = st.checkbox("Only fetch the films logged since the last fetch", value=True)
+
 if st.button("Fetch Diary") and st.session_state.username:
-    try:
-        total_pages = get_total_pages(st.session_state.username)
-    except httpx.HTTPStatusError:
-        st.error(f"User '{
-                 st.session_state.username}' not found. Please check the username and try again.")
+    # Attaches to the crawl of this username if another session already started it
+    get_job_manager().submit(st.session_state.username, incremental)
+    st.session_state.job_username = st.session_state.username
+    st.session_state.diary_shown = False
+
+if st.session_state.job_username is not None:
+    follow_job()
+
+job = st.session_state.finished_job
+if job is not None:
+    st.session_state.finished_job = None
+    if job.status == "failed":
+        if isinstance(job.error, httpx.HTTPStatusError):
+            st.error(f"User '{
+                     job.username}' not found. Please check the username and try again.")
+        elif isinstance(job.error, httpx.TimeoutException):
+            st.error("The request timed out. Please try again.")
+        else:
+            st.error(f"Fetching the diary of '{job.username}' failed: {job.error}")
+    elif job.status == "cancelled":
+        st.warning("The fetch was cancelled. Please try again.")
     else:
-        with st.spinner("Fetching data..."):
-            try:
-                df: pd.DataFrame = asyncio.run(
-                    main(st.session_state.username, total_pages))
-                st.session_state.df = df  # Save dataframe to session state
-                st.success("Data fetched successfully!")
-                if df.empty:
-                    st.error(f"No data found for user '{
-                             st.session_state.username}'. Please check the username and try again.")
-
-            except AttributeError as e:
-                if "PoolTimeoutError" in str(e):
-                    st.error("The request timed out. Please try again.")
-        if st.session_state.df.empty:
+        df: pd.DataFrame = job.df
+        st.session_state.df = df  # Save dataframe to session state
+        # Aggregates shared by every chart, computed once per fetch rather than once per chart,
+        # and keyed by the version of the dataset so that the charts are cached without hashing it
+        st.session_state.stats = compute_profile_stats(
+            df, dataset_key(job.username, df))
+        if df.empty:
             st.error(f"No data found for user '{
-                     st.session_state.username}'. Please check the username and try again.")
+                     job.username}'. Please check the username and try again.")
+        elif job.missing_films:
+            st.warning(f"The details of {len(job.missing_films)} films could not be fetched: their entries "
+                       "are left out and the diary was not saved. Fetch it again to complete it.")
+        else:
+            st.success("Data fetched successfully!")
 
 # Display data
 if st.session_state.df is not None and not st.session_state.df.empty:
+    if st.session_state.stats is None:
+        st.session_state.stats = compute_profile_stats(
+            st.session_state.df, dataset_key(st.session_state.username, st.session_state.df))
+    stats = st.session_state.stats
+
     tab_level1, tab_level2 = st.tabs(
         ["Page 1", "Page 2"])
 
@@ -73,63 +228,50 @@ if st.session_state.df is not None and not st.session_state.df.empty:
         col1, col2 = st.columns(2)
 
         with col1:
-            fig = draw_top3(st.session_state.df)
-            st.pyplot(fig)
+            show_chart("draw_top3", stats)
 
         with col2:
-            fig = draw_top_countries(st.session_state.df)
-            st.plotly_chart(fig)
+            show_chart("draw_top_countries", stats)
 
         col3, col4 = st.columns(2)
 
         with col3:
-            fig = draw_log_timeline(st.session_state.df)
-            st.plotly_chart(fig)
+            show_chart("draw_log_timeline", stats)
 
         with col4:
-            fig = draw_top_genres(st.session_state.df)
-            st.plotly_chart(fig)
+            show_chart("draw_top_genres", stats)
 
         col5, col6 = st.columns(2)
 
         with col5:
-            fig = draw_rating_dist(st.session_state.df)
-            st.plotly_chart(fig)
+            show_chart("draw_rating_dist", stats)
 
         with col6:
-            fig = draw_top_actors(st.session_state.df)
-            st.plotly_chart(fig)
+            show_chart("draw_top_actors", stats)
 
     with tab_level2:
 
         col1, col2 = st.columns([0.2, 0.2])
 
         with col1:
-            fig, title, subtitle = draw_studios_radar(st.session_state.df)
-            st.markdown(f"""
-            # {title}
-            {subtitle}
-            """)
-            st.pyplot(fig)
+            show_chart("draw_studios_radar", stats)
 
         with col2:
-            fig, title, subtitle = draw_decades_radar(st.session_state.df)
-            st.markdown(f"""
-            # {title}
-            {subtitle}
-            """)
-            st.pyplot(fig)
+            show_chart("draw_decades_radar", stats)
 
         cont = st.container(border=True)
         with cont:
-            fig, title, subtitle = draw_lang_sankey(st.session_state.df)
-            st.markdown(f"""
-                    # {title}
-                    {subtitle}
-                    """)
-            st.plotly_chart(fig)
+            show_chart("draw_lang_sankey", stats)
 
+        selected_column = st.selectbox(
+            "Count the films logged by:", list(FILTER_COLUMNS),
+            index=list(FILTER_COLUMNS).index(st.session_state.selected_column))
         st.session_state.selected_column = selected_column
-        df_filtered = compute_df_by_filter(
-            st.session_state.df, st.session_state.selected_column)
-        st.write(df_filtered)
+        if stats.has_film_details:
+            df_filtered = compute_df_by_filter(
+                stats, st.session_state.selected_column)
+            st.write(df_filtered)
+
+capture = st.session_state.pop("profile_capture", None)
+if capture is not None and capture.stop():
+    st.sidebar.caption(f"Render profile written to {capture.paths[0]}")
@@ -0,0 +1,169 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from contextlib import contextmanager
+from bisect import bisect_left
+from time import perf_counter
+import threading
+import os
+
+
+# Upper bounds of the buckets of the histograms, in seconds and in bytes
+TIME_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (1_000, 10_000, 50_000, 100_000, 250_000, 500_000, 1_000_000, 5_000_000)
+
+# Port of the Prometheus endpoint started by the app, none if unset
+METRICS_PORT = os.environ.get("LETTERBOARD_METRICS_PORT")
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in sorted(labels.items())) + "}"
+
+
+class Histogram:
+    """ Cumulative histogram of observed values, one series per set of labels """
+
+    def __init__(self, name: str, description: str, buckets: tuple = TIME_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self._series: dict[tuple, list] = {}     # labels -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.setdefault(key, [0] * (len(self.buckets) + 1) + [0.0])
+            series[bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - start, **labels)
+
+    def summary(self) -> list[dict]:
+        """ Count, sum, mean and bucket estimates of the median and 95th percentile of each series """
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+
+        rows = []
+        for key, values in series.items():
+            counts, total = values[:-1], values[-1]
+            count = sum(counts)
+            rows.append({"metric": self.name, **dict(key), "count": count, "sum": round(total, 3),
+                         "mean": round(total / count, 4) if count else None,
+                         "p50": self._quantile(counts, 0.5), "p95": self._quantile(counts, 0.95)})
+        return rows
+
+    def _quantile(self, counts: list[int], q: float) -> float | None:
+        """ Upper bound of the bucket holding the quantile q, None past the last bucket """
+        target = q * sum(counts)
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            if cumulative >= target:
+                return bound
+        return None
+
+    def expose(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+
+        for key, values in sorted(series.items()):
+            labels = dict(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), values[:-1]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels({**labels, 'le': bound})} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(labels)} {values[-1]}")
+            lines.append(f"{self.name}_count{_labels(labels)} {cumulative}")
+        return lines
+
+
+class Counter:
+    """ Monotonic count of events, one series per set of labels """
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._series: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def summary(self) -> list[dict]:
+        with self._lock:
+            return [{"metric": self.name, **dict(key), "count": value} for key, value in self._series.items()]
+
+    def expose(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            series = dict(self._series)
+        lines += [f"{self.name}{_labels(dict(key))} {value}" for key, value in sorted(series.items())]
+        return lines
+
+
+# Metrics of the process, shared by every crawl and every render
+fetch_seconds = Histogram("letterboard_fetch_seconds",
+                          "Time to the response headers of each request sent to the network, by kind of page")
+fetch_bytes = Histogram("letterboard_fetch_bytes", "Size of the fetched pages, by kind of page", SIZE_BUCKETS)
+fetch_responses = Counter("letterboard_fetch_responses_total", "HTTP responses, by kind of page and status code")
+fetch_retries = Counter("letterboard_fetch_retries_total", "Retried HTTP requests, by kind of page")
+circuit_opened = Counter("letterboard_circuit_opened_total", "Circuit breaker trips pausing a host, by host")
+stage_seconds = Histogram("letterboard_stage_seconds",
+                          "Duration of the crawl stages: total pages, parsing and DataFrame assembly")
+draw_seconds = Histogram("letterboard_draw_seconds", "Duration of the drawing of each chart")
+render_seconds = Histogram("letterboard_render_seconds", "Duration of the rendering of each chart for the browser")
+
+REGISTRY = [fetch_seconds, fetch_bytes, fetch_responses, fetch_retries, circuit_opened,
+            stage_seconds, draw_seconds, render_seconds]
+
+
+def page_kind(url: str) -> str:
+    """ Kind of a letterboxd page, a label with few values unlike the url itself """
+    return "diary" if "/films/diary/" in url else "film"
+
+
+def expose() -> str:
+    """ Every metric in the Prometheus text format """
+    return "\n".join(line for metric in REGISTRY for line in metric.expose()) + "\n"
+
+
+def summary() -> list[dict]:
+    """ One row per series of every metric, for display """
+    return [row for metric in REGISTRY for row in metric.summary()]
+
+
+def write_text_file(path: str) -> None:
+    """ Write the metrics for the Prometheus node exporter textfile collector """
+    with open(f"{path}.tmp", "w") as file:
+        file.write(expose())
+    os.replace(f"{path}.tmp", path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        body = expose().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+def serve(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """ Serve the metrics in the Prometheus text format from a background thread """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
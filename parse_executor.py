@@ -0,0 +1,124 @@
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable
+from time import perf_counter
+import multiprocessing
+import metrics
+import asyncio
+import os
+
+
+# Where the pages are parsed: "thread" (default thread pool), "process" (one process per core) or "inline"
+PARSE_BACKEND = os.environ.get("LETTERBOARD_PARSE_BACKEND", "thread")
+PARSE_BACKENDS = ("thread", "process", "inline")
+
+# Pages sent at once to a worker process, to amortise the cost of pickling and of the round-trip
+PROCESS_BATCH_SIZE = 16
+PROCESS_BATCH_DELAY = 0.005
+
+
+def parse_batch(func: Callable[[str], Any], contents: list[str]) -> list[tuple[bool, Any, float]]:
+    """ Parse a batch of pages in a worker, a page failing to parse not failing the whole batch.
+        The time taken by each page is returned with it, worker processes having their own metrics.
+    """
+    results = []
+    for content in contents:
+        start = perf_counter()
+        try:
+            results.append((True, func(content), perf_counter() - start))
+        except Exception as e:
+            results.append((False, e, perf_counter() - start))
+    return results
+
+
+class ParseExecutor:
+    """ Runs the page parsers off the event loop, in a thread pool, a process pool or inline.
+
+        Pages are submitted in batches: a batch is sent to the pool when it is full, or
+        batch_delay seconds after its first page arrived.
+    """
+
+    def __init__(self, backend: str = PARSE_BACKEND, max_workers: int | None = None,
+                 batch_size: int | None = None, batch_delay: float = PROCESS_BATCH_DELAY):
+        if backend not in PARSE_BACKENDS:
+            raise ValueError(f"Unknown parse backend '{backend}', expected one of {PARSE_BACKENDS}")
+
+        self.backend = backend
+        self.max_workers = max_workers
+        self.batch_size = batch_size or (PROCESS_BATCH_SIZE if backend == "process" else 1)
+        self.batch_delay = batch_delay
+
+        self._executor: Executor | None = None
+        self._pending: dict[Callable, list[tuple[str, asyncio.Future]]] = {}
+        self._flush_handles: dict[Callable, asyncio.TimerHandle] = {}
+
+    def _get_executor(self) -> Executor:
+        # Created on first use, so that an inline or unused executor never starts workers
+        if self._executor is None:
+            if self.backend == "process":
+                # Spawned rather than forked, the app process runs threads
+                self._executor = ProcessPoolExecutor(
+                    self.max_workers or os.cpu_count(), mp_context=multiprocessing.get_context("spawn"))
+            else:
+                self._executor = ThreadPoolExecutor(self.max_workers)
+        return self._executor
+
+    async def parse(self, func: Callable[[str], Any], content: str) -> Any:
+        """ Parse a page with func, which must be picklable (a module level function) for processes """
+        if self.backend == "inline":
+            with metrics.stage_seconds.time(stage=func.__name__):
+                return func(content)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        batch = self._pending.setdefault(func, [])
+        batch.append((content, future))
+
+        if len(batch) >= self.batch_size:
+            self._flush(func)
+        elif func not in self._flush_handles:
+            self._flush_handles[func] = loop.call_later(self.batch_delay, self._flush, func)
+
+        return await future
+
+    def _flush(self, func: Callable) -> None:
+        handle = self._flush_handles.pop(func, None)
+        if handle is not None:
+            handle.cancel()
+
+        batch = self._pending.pop(func, [])
+        if not batch:
+            return
+
+        contents = [content for content, _ in batch]
+        futures = [future for _, future in batch]
+
+        loop = asyncio.get_running_loop()
+        batch_future = loop.run_in_executor(self._get_executor(), parse_batch, func, contents)
+
+        def resolve(batch_future: asyncio.Future) -> None:
+            for i, future in enumerate(futures):
+                if future.done():
+                    continue
+                if batch_future.cancelled():
+                    future.cancel()
+                elif batch_future.exception() is not None:
+                    future.set_exception(batch_future.exception())
+                else:
+                    ok, value, seconds = batch_future.result()[i]
+                    metrics.stage_seconds.observe(seconds, stage=func.__name__)
+                    if ok:
+                        future.set_result(value)
+                    else:
+                        future.set_exception(value)
+
+        batch_future.add_done_callback(resolve)
+
+    def close(self) -> None:
+        for handle in self._flush_handles.values():
+            handle.cancel()
+        self._flush_handles.clear()
+        self._pending.clear()
+
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
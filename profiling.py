@@ -0,0 +1,138 @@
+from collections import Counter, defaultdict
+from datetime import datetime
+import tracemalloc
+import threading
+import cProfile
+import pstats
+import os
+import io
+
+
+# Profile every crawl and dashboard render of the process
+PROFILE = os.environ.get("LETTERBOARD_PROFILE", "") not in ("", "0")
+PROFILE_DIR = os.environ.get("LETTERBOARD_PROFILE_DIR", "profiles")
+
+# Token to pass as ?profile=<token> to profile a single render of the app, none to disable it
+PROFILE_TOKEN = os.environ.get("LETTERBOARD_PROFILE_TOKEN")
+
+# Frames kept per allocation, and allocation sites written
+TRACEMALLOC_FRAMES = 10
+TOP_ALLOCATIONS = 30
+
+# Stacks deeper than this, or taking less than a microsecond, are left out of the collapsed stacks
+MAX_STACK_DEPTH = 64
+
+# A thread can only run one profiler at a time, and tracemalloc is process-wide
+_active_lock = threading.Lock()
+
+
+def _label(func: tuple) -> str:
+    filename, line, name = func
+    return f"{os.path.basename(filename)}:{name}:{line}" if line else name
+
+
+def collapsed_stacks(stats: pstats.Stats) -> list[str]:
+    """ Approximate the profile as collapsed stacks ('a;b;c microseconds'), the input of flamegraph.pl.
+        cProfile only records caller -> callee edges, so the time of a function is split between
+        its call paths in proportion to the time of each edge.
+    """
+    callees = defaultdict(list)
+    for func, (_, _, _, _, callers) in stats.stats.items():
+        for caller, edge in callers.items():
+            callees[caller].append((func, edge[3]))
+
+    samples = Counter()
+
+    def walk(func: tuple, stack: tuple, time: float) -> None:
+        _, _, self_time, total_time, _ = stats.stats[func]
+        if total_time <= 0 or time < 1e-6 or len(stack) >= MAX_STACK_DEPTH:
+            return
+        scale = time / total_time
+        stack = stack + (_label(func),)
+        samples[stack] += self_time * scale
+        for callee, edge_time in callees[func]:
+            # Recursive calls are folded into the outermost one
+            if _label(callee) not in stack:
+                walk(callee, stack, edge_time * scale)
+
+    for func, (_, _, _, total_time, callers) in stats.stats.items():
+        if not callers:
+            walk(func, (), total_time)
+
+    return [f"{';'.join(stack)} {round(time * 1e6)}"
+            for stack, time in samples.most_common() if round(time * 1e6) > 0]
+
+
+class Capture:
+    """ cProfile and tracemalloc capture of a crawl or a render, written to timestamped files:
+        <name>.pstats, <name>.collapsed (flame graph stacks) and <name>.alloc.txt (top allocation sites).
+
+        Only one capture runs at a time in the process, the others are no-ops.
+    """
+
+    def __init__(self, name: str, directory: str = PROFILE_DIR):
+        self.name = name
+        self.directory = directory
+        self.paths: list[str] = []
+        self._profiler: cProfile.Profile | None = None
+
+    def start(self) -> "Capture":
+        if not _active_lock.acquire(blocking=False):
+            return self
+
+        self._profiler = cProfile.Profile()
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+        self._profiler.enable()
+        return self
+
+    def stop(self) -> list[str]:
+        """ Stop the capture and write its files, returning their paths """
+        if self._profiler is None:
+            return self.paths
+
+        try:
+            self._profiler.disable()
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            self._write(pstats.Stats(self._profiler), snapshot)
+        finally:
+            self._profiler = None
+            _active_lock.release()
+        return self.paths
+
+    def _write(self, stats: pstats.Stats, snapshot: tracemalloc.Snapshot) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        prefix = os.path.join(self.directory, f"{datetime.now():%Y%m%d-%H%M%S}-{self.name}")
+
+        stats.dump_stats(f"{prefix}.pstats")
+
+        with open(f"{prefix}.collapsed", "w") as file:
+            file.write("\n".join(collapsed_stacks(stats)) + "\n")
+
+        snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__),
+                                           tracemalloc.Filter(False, __file__)])
+        report = io.StringIO()
+        for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]:
+            report.write(f"{stat}\n")
+            for line in stat.traceback.format()[-4:]:
+                report.write(f"    {line}\n")
+        with open(f"{prefix}.alloc.txt", "w") as file:
+            file.write(report.getvalue())
+
+        self.paths = [f"{prefix}.pstats", f"{prefix}.collapsed", f"{prefix}.alloc.txt"]
+
+    def __enter__(self) -> "Capture":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+def capture(name: str, enabled: bool = PROFILE) -> Capture | None:
+    """ A started capture if profiling is enabled, None otherwise """
+    return Capture(name).start() if enabled else None
+
+
+def safe_name(value: str) -> str:
+    """ Username or label usable in a file name """
+    return "".join(char if char.isalnum() or char in "-_" else "_" for char in value)
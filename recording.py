@@ -0,0 +1,89 @@
+from scheduler import HostScheduler, SchedulingTransport
+from film_cache import FilmCache
+from scrapper import main
+import tempfile
+import argparse
+import asyncio
+import httpx
+import os
+import re
+
+
+DEFAULT_FIXTURES_DIR = "fixtures"
+
+_DIARY_PAGE = re.compile(r"^/([^/]+)/films/diary/(?:page/(\d+)/)?$")
+_FILM_PAGE = re.compile(r"^/film/([^/]+)/$")
+
+
+def fixture_path(fixtures_dir: str, url: httpx.URL) -> str | None:
+    """ Path of the fixture recording url, or None if it is neither a diary nor a film page """
+    match = _DIARY_PAGE.match(url.path)
+    if match:
+        username, page = match.group(1), int(match.group(2) or 1)
+        return os.path.join(fixtures_dir, "diary", f"{username}-{page:04d}.html")
+
+    match = _FILM_PAGE.match(url.path)
+    if match:
+        return os.path.join(fixtures_dir, "film", f"{match.group(1)}.html")
+
+    return None
+
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    """ Transport saving every successful diary and film page it fetches as a fixture """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, fixtures_dir: str = DEFAULT_FIXTURES_DIR):
+        self._transport = transport
+        self.fixtures_dir = fixtures_dir
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        response = await self._transport.handle_async_request(request)
+
+        path = fixture_path(self.fixtures_dir, request.url)
+        if response.status_code != 200 or path is None:
+            return response
+
+        # Transport level responses are not decoded yet
+        decoded = httpx.Response(response.status_code, headers=response.headers,
+                                 stream=response.stream)
+        body = await decoded.aread()
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(body)
+
+        headers = [(name, value) for name, value in response.headers.multi_items()
+                   if name.lower() not in ("content-encoding", "content-length", "transfer-encoding")]
+        return httpx.Response(response.status_code, headers=headers, content=body,
+                              request=request, extensions=response.extensions)
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+async def record(username: str, fixtures_dir: str = DEFAULT_FIXTURES_DIR, total_pages: int | None = None) -> None:
+    """ Crawl the diary of a user on letterboxd, recording every page as a fixture """
+    # Under the same per-host limits as any crawl of letterboxd, without the HTTP cache of make_client
+    scheduler = HostScheduler()
+    transport = httpx.AsyncHTTPTransport(http2=True, limits=scheduler.limits())
+    transport = RecordingTransport(SchedulingTransport(transport, scheduler), fixtures_dir)
+
+    # An empty film cache, so that every film page is actually fetched and recorded
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = FilmCache(os.path.join(cache_dir, "films.sqlite3"))
+        async with httpx.AsyncClient(transport=transport, timeout=10.0) as client:
+            df = await main(username, total_pages, cache=cache, scheduler=scheduler, client=client)
+        cache.close()
+    print(f"Recorded {df.shape[0]} diary entries of '{username}' in {fixtures_dir}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Record the diary and film pages of a user as fixtures for replay_server.py")
+    parser.add_argument("username")
+    parser.add_argument("--fixtures", default=DEFAULT_FIXTURES_DIR)
+    parser.add_argument("--pages", type=int, default=None,
+                        help="number of diary pages to record (all by default)")
+    args = parser.parse_args()
+
+    asyncio.run(record(args.username, args.fixtures, args.pages))
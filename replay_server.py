@@ -0,0 +1,188 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from dataclasses import dataclass
+from recording import DEFAULT_FIXTURES_DIR
+import threading
+import argparse
+import hashlib
+import random
+import time
+import os
+import re
+
+
+_DIARY_PAGE = re.compile(r"^/([^/]+)/films/diary/(?:page/(\d+)/)?$")
+_FILM_PAGE = re.compile(r"^/film/([^/]+)/$")
+_FILM_POSTER = re.compile(r'data-film-poster="/film/([^/"]+)/')
+
+# Suffix added to the film slugs of each replayed diary page, so that a long synthetic diary
+# made of a few recorded pages still links to distinct films
+_PAGE_SUFFIX = re.compile(r"--p\d+$")
+
+
+@dataclass
+class ReplayConfig:
+    latency: float = 0.05       # seconds added to every response
+    jitter: float = 0.02        # standard deviation of the latency
+    error_rate: float = 0.0     # share of responses replaced by a 503
+    throttle_rate: float = 0.0  # share of responses replaced by a 429 with a Retry-After
+    films_per_page: int = 50    # for the synthetic pages, when no fixture was recorded
+
+
+def synthetic_diary_page(page: int, films_per_page: int) -> str:
+    """ A diary page with the markup parse_content relies on """
+    films = "".join(
+        f'<tr><td><a rel="nofollow" data-film-name="Film {page}-{i}" data-rating="{i % 10 + 1}" '
+        f'data-film-year="{1950 + (page * 7 + i) % 75}" data-liked="{"true" if i % 3 == 0 else "false"}" '
+        f'data-viewing-date="2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}" '
+        f'data-film-poster="/film/film-{i}/image-150/">Film {page}-{i}</a></td></tr>'
+        for i in range(films_per_page)
+    )
+    return f'<html><body><table>{films}</table><ul><li class="paginate-page"><a>1</a></li></ul></body></html>'
+
+
+def synthetic_film_page(slug: str) -> str:
+    """ A film page with the markup parse_film_details relies on """
+    n = int(hashlib.sha1(slug.encode()).hexdigest(), 16)
+    actors = "".join(f'<a href="/actor/actor-{(n >> i) % 500}/">Actor {(n >> i) % 500}</a>'
+                     for i in range(20))
+    genres = "".join(f'<a href="/films/genre/genre-{(n >> i) % 19}/">Genre {(n >> i) % 19}</a>'
+                     for i in range(3))
+    return (
+        f'<html><head><meta name="twitter:data2" content="{1 + n % 40 / 10:.2f} out of 5"></head><body>'
+        f'<p class="text-link text-footer">{80 + n % 100}&nbsp;mins &nbsp; More at</p>'
+        f'<a href="/director/director-{n % 300}/">Director {n % 300}</a>{actors}'
+        f'<a href="/studio/studio-{n % 40}/">Studio {n % 40}</a>'
+        f'<a href="/films/country/country-{n % 30}/">Country {n % 30}</a>'
+        f'<a href="/films/language/language-{n % 25}/">Language {n % 25}</a>{genres}'
+        f'</body></html>'
+    )
+
+
+class Fixtures:
+    """ Recorded diary and film pages, replayed in a loop to make diaries of any length """
+
+    def __init__(self, fixtures_dir: str, films_per_page: int = 50):
+        self.films_per_page = films_per_page
+
+        diary_dir = os.path.join(fixtures_dir, "diary")
+        self.diary_pages = [self._read(os.path.join(diary_dir, name))
+                            for name in sorted(os.listdir(diary_dir))] if os.path.isdir(diary_dir) else []
+
+        film_dir = os.path.join(fixtures_dir, "film")
+        self.film_pages = {name[:-len(".html")]: self._read(os.path.join(film_dir, name))
+                           for name in sorted(os.listdir(film_dir))} if os.path.isdir(film_dir) else {}
+        self._film_slugs = sorted(self.film_pages)
+
+    @staticmethod
+    def _read(path: str) -> str:
+        with open(path, encoding="utf-8") as f:
+            return f.read()
+
+    def diary_page(self, page: int) -> str:
+        if not self.diary_pages:
+            content = synthetic_diary_page(page, self.films_per_page)
+        else:
+            content = self.diary_pages[(page - 1) % len(self.diary_pages)]
+        return _FILM_POSTER.sub(lambda m: f'data-film-poster="/film/{m.group(1)}--p{page}/', content)
+
+    def film_page(self, slug: str) -> str:
+        slug = _PAGE_SUFFIX.sub("", slug)
+        if slug in self.film_pages:
+            return self.film_pages[slug]
+        if self._film_slugs:
+            n = int(hashlib.sha1(slug.encode()).hexdigest(), 16)
+            return self.film_pages[self._film_slugs[n % len(self._film_slugs)]]
+        return synthetic_film_page(slug)
+
+
+def make_handler(fixtures: Fixtures, config: ReplayConfig) -> type[BaseHTTPRequestHandler]:
+
+    class ReplayHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            time.sleep(max(0.0, random.gauss(config.latency, config.jitter)))
+
+            draw = random.random()
+            if draw < config.error_rate:
+                return self._send(503, b"")
+            if draw < config.error_rate + config.throttle_rate:
+                return self._send(429, b"", {"Retry-After": "1"})
+
+            match = _DIARY_PAGE.match(self.path)
+            if match:
+                return self._send(200, fixtures.diary_page(int(match.group(2) or 1)).encode())
+
+            match = _FILM_PAGE.match(self.path)
+            if match:
+                return self._send(200, fixtures.film_page(match.group(1)).encode())
+
+            self._send(404, b"")
+
+        def _send(self, status: int, body: bytes, headers: dict | None = None) -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ReplayHandler
+
+
+class _ReplayHTTPServer(ThreadingHTTPServer):
+    # Read by listen() in the constructor: the benchmarks open up to 64 connections at once
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+class ReplayServer:
+    """ Local stand-in for letterboxd serving the fixtures, with configurable latency and errors.
+        Usable as a context manager running the server in a background thread.
+    """
+
+    def __init__(self, fixtures_dir: str = DEFAULT_FIXTURES_DIR, config: ReplayConfig | None = None,
+                 host: str = "127.0.0.1", port: int = 0):
+        self.config = config or ReplayConfig()
+        fixtures = Fixtures(fixtures_dir, self.config.films_per_page)
+
+        self._server = _ReplayHTTPServer((host, port), make_handler(fixtures, self.config))
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self) -> "ReplayServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def serve_forever(self) -> None:
+        self._server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay recorded letterboxd pages locally")
+    parser.add_argument("--fixtures", default=DEFAULT_FIXTURES_DIR)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    config = ReplayConfig(args.latency, args.jitter, args.error_rate, args.throttle_rate)
+    server = ReplayServer(args.fixtures, config, port=args.port)
+    print(f"Replaying {args.fixtures} on {server.url}, crawl it with LETTERBOARD_BASE_URL={server.url}")
+    server.serve_forever()
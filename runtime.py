@@ -0,0 +1,33 @@
+from scheduler import HostScheduler, SchedulerConfig
+from parse_executor import PARSE_BACKEND, ParseExecutor
+from film_cache import FilmCache
+from scrapper import make_client
+import threading
+import asyncio
+
+
+class CrawlRuntime:
+    """ Event loop running in a background thread of the app process, holding the HTTP client,
+        scheduler, film cache and parse executor shared by every session and every rerun.
+
+        The client's connections are bound to the loop they were opened in, so the crawls of
+        all sessions are submitted to this single loop instead of running in their own asyncio.run().
+    """
+
+    def __init__(self, scheduler_config: SchedulerConfig | None = None, parse_backend: str = PARSE_BACKEND):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self.loop.run_forever, name="crawl-runtime", daemon=True)
+        self._thread.start()
+
+        self.scheduler = HostScheduler(scheduler_config)
+        self.client = make_client(self.scheduler)
+        self.cache = FilmCache()
+        self.executor = ParseExecutor(parse_backend)
+
+    def close(self) -> None:
+        asyncio.run_coroutine_threadsafe(self.client.aclose(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.cache.close()
+        self.executor.close()
@@ -0,0 +1,209 @@
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from dataclasses import dataclass, field, replace
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+from collections import deque
+from time import monotonic, perf_counter
+import asyncio
+import metrics
+import httpx
+
+
+@dataclass
+class SchedulerConfig:
+    """ Limits applied to every host the scraper talks to """
+    max_concurrency: int = 16       # simultaneous requests per host
+    max_pages_in_flight: int = 4    # diary pages whose film details are fetched at the same time
+    initial_rate: float = 10.0      # requests per second
+    min_rate: float = 0.5
+    max_rate: float = 50.0
+    burst: float = 10.0             # size of the token bucket
+    increase: float = 1.0           # additive increase, in requests per second per second
+    decrease: float = 0.5           # multiplicative decrease on 429 / 5xx
+    decrease_interval: float = 1.0  # seconds between two decreases, the failures of a burst count once
+    retry_ratio: float = 0.1        # retries earned per successful request
+    retry_burst: float = 10.0       # retries allowed before any request succeeded
+    breaker_window: int = 20        # last responses the error rate is computed on
+    breaker_threshold: float = 0.5  # error rate opening the circuit
+    breaker_cooldown: float = 5.0   # seconds the circuit stays open, doubled while errors persist
+    max_cooldown: float = 60.0
+
+    def capped(self, rate: float) -> "SchedulerConfig":
+        """ Same limits with at most rate requests per second: the rate starts at and never grows past
+            it, and a burst holds at most a second of requests
+        """
+        return replace(self, initial_rate=rate, min_rate=min(self.min_rate, rate), max_rate=rate,
+                       burst=max(1.0, min(self.burst, rate)))
+
+
+@dataclass
+class _HostState:
+    semaphore: asyncio.Semaphore
+    rate: float
+    tokens: float
+    updated: float = field(default_factory=monotonic)
+    paused_until: float = 0.0
+    retry_tokens: float = 0.0
+    outcomes: deque = field(default_factory=deque)  # True for each failed request of the window
+    cooldown: float = 0.0
+    last_decrease: float = float("-inf")
+
+
+def parse_retry_after(response: httpx.Response) -> float | None:
+    """ Return the delay in seconds asked by the Retry-After header, if any """
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class HostScheduler:
+    """ Per-host semaphore plus a token bucket whose rate adapts to the responses (AIMD):
+        the rate grows slowly while requests succeed and is cut on 429 / 5xx, and
+        a Retry-After header pauses every request to that host.
+
+        Retries draw from a per-host budget refilled by successful requests, and a circuit
+        breaker pauses every request to a host whose recent error rate spikes.
+    """
+
+    def __init__(self, config: SchedulerConfig | None = None):
+        self.config = config or SchedulerConfig()
+        self._hosts: dict[str, _HostState] = {}
+
+    def _state(self, url: str) -> _HostState:
+        host = urlsplit(url).netloc
+        if host not in self._hosts:
+            self._hosts[host] = _HostState(
+                semaphore=asyncio.Semaphore(self.config.max_concurrency),
+                rate=self.config.initial_rate,
+                tokens=self.config.burst,
+                retry_tokens=self.config.retry_burst,
+                outcomes=deque(maxlen=self.config.breaker_window),
+            )
+        return self._hosts[host]
+
+    async def _acquire_token(self, state: _HostState) -> None:
+        while True:
+            now = monotonic()
+            if now < state.paused_until:
+                await asyncio.sleep(state.paused_until - now)
+                continue
+
+            state.tokens = min(self.config.burst,
+                               state.tokens + (now - state.updated) * state.rate)
+            state.updated = now
+
+            if state.tokens >= 1:
+                state.tokens -= 1
+                return
+
+            await asyncio.sleep((1 - state.tokens) / state.rate)
+
+    @asynccontextmanager
+    async def slot(self, url: str):
+        """ Wait for a free connection slot and a token before requesting url """
+        state = self._state(url)
+        async with state.semaphore:
+            await self._acquire_token(state)
+            yield
+
+    def on_response(self, url: str, response: httpx.Response) -> None:
+        """ Adapt the rate of the host to the status of a response """
+        state = self._state(url)
+
+        if response.status_code == 429 or response.status_code >= 500:
+            # The requests in flight when the host started failing all fail: the rate is cut
+            # once for them rather than once each, down to the minimum at the first burst
+            now = monotonic()
+            if now - state.last_decrease >= self.config.decrease_interval:
+                state.rate = max(self.config.min_rate,
+                                 state.rate * self.config.decrease)
+                state.last_decrease = now
+            state.tokens = min(state.tokens, 0.0)
+
+            retry_after = parse_retry_after(response)
+            if retry_after is not None:
+                state.paused_until = max(state.paused_until,
+                                         monotonic() + retry_after)
+            self._record(url, state, failed=True)
+        else:
+            state.rate = min(self.config.max_rate,
+                             state.rate + self.config.increase / state.rate)
+            state.retry_tokens = min(self.config.retry_burst,
+                                     state.retry_tokens + self.config.retry_ratio)
+            self._record(url, state, failed=False)
+
+    def on_error(self, url: str) -> None:
+        """ Count a request that got no response (connection error, timeout) as a failure """
+        self._record(url, self._state(url), failed=True)
+
+    def _record(self, url: str, state: _HostState, failed: bool) -> None:
+        state.outcomes.append(failed)
+        if not failed:
+            state.cooldown = 0.0
+            return
+
+        window = state.outcomes
+        if len(window) < window.maxlen or sum(window) / len(window) < self.config.breaker_threshold:
+            return
+
+        # Open the circuit: every request to the host waits for the cooldown, longer each
+        # time the errors go on right after it, and the window starts over
+        state.cooldown = min(self.config.max_cooldown,
+                             state.cooldown * 2 if state.cooldown else self.config.breaker_cooldown)
+        state.paused_until = max(state.paused_until, monotonic() + state.cooldown)
+        window.clear()
+        metrics.circuit_opened.inc(host=urlsplit(url).netloc)
+
+    def allow_retry(self, url: str) -> bool:
+        """ Take a retry from the budget of the host, False once it is exhausted """
+        state = self._state(url)
+        if state.retry_tokens < 1:
+            return False
+        state.retry_tokens -= 1
+        return True
+
+    def limits(self) -> httpx.Limits:
+        """ Connection pool limits matching the scheduler concurrency """
+        return httpx.Limits(max_connections=self.config.max_concurrency,
+                            max_keepalive_connections=self.config.max_concurrency)
+
+
+class SchedulingTransport(httpx.AsyncBaseTransport):
+    """ Transport sending every request through the scheduler of its host: it waits for a slot
+        and a token, and the rate of the host adapts to the response or the connection error.
+        Placed below the response cache, so that the responses served from disk skip the scheduler.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, scheduler: HostScheduler):
+        self._transport = transport
+        self.scheduler = scheduler
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        url = str(request.url)
+        try:
+            async with self.scheduler.slot(url):
+                # Time spent waiting for a slot is not part of the latency
+                start = perf_counter()
+                response = await self._transport.handle_async_request(request)
+                metrics.fetch_seconds.observe(perf_counter() - start, kind=metrics.page_kind(url))
+        except httpx.TransportError:
+            self.scheduler.on_error(url)
+            raise
+
+        self.scheduler.on_response(url, response)
+        return response
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
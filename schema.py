@@ -0,0 +1,55 @@
+import pyarrow as pa
+import pandas as pd
+import numpy as np
+
+
+# Low-cardinality text columns, repeated across many diary entries
+CATEGORY_COLUMNS = ["country", "studio", "primary_language", "director"]
+
+# Columns holding a list of names per diary entry
+LIST_COLUMNS = ["genres", "actors"]
+
+# Columns parsed from the film pages, missing from a diary whose film details are not fetched yet
+DETAIL_COLUMNS = ["country", "studio", "primary_language", "genres", "director", "actors",
+                  "running_time", "average_rating"]
+LIST_DTYPE = pd.ArrowDtype(pa.list_(pa.string()))
+
+
+def _to_list_column(column: pd.Series) -> pd.Series:
+    if isinstance(column.dtype, pd.ArrowDtype) and pa.types.is_list(column.dtype.pyarrow_dtype):
+        return column
+
+    values = [list(value) if isinstance(value, (list, tuple, np.ndarray)) else None
+              for value in column]
+    return pd.Series(pa.array(values, type=LIST_DTYPE.pyarrow_dtype), index=column.index, dtype=LIST_DTYPE)
+
+
+def apply_schema(df: pd.DataFrame) -> pd.DataFrame:
+    """ Convert the scraped diary (strings and Python lists) to compact typed columns:
+        numeric ratings, boolean likes, datetime log dates, categoricals and Arrow list columns.
+        Applying it to an already typed diary is a no-op, so it can be re-applied after merging diaries.
+    """
+    df = df.copy()
+
+    if "rating" in df:
+        df["rating"] = pd.to_numeric(df["rating"], errors="coerce").astype("float32")
+    if "date" in df:
+        df["date"] = pd.to_numeric(df["date"], errors="coerce").astype("Int16")
+    if "liked" in df and df["liked"].dtype != bool:
+        df["liked"] = df["liked"].astype(str).str.lower().eq("true")
+    if "log_date" in df:
+        df["log_date"] = pd.to_datetime(df["log_date"])
+    if "running_time" in df:
+        df["running_time"] = pd.to_numeric(df["running_time"], errors="coerce").astype("Int16")
+    if "average_rating" in df:
+        df["average_rating"] = pd.to_numeric(df["average_rating"], errors="coerce").astype("float32")
+
+    for column in CATEGORY_COLUMNS:
+        if column in df:
+            df[column] = df[column].astype("category")
+
+    for column in LIST_COLUMNS:
+        if column in df:
+            df[column] = _to_list_column(df[column])
+
+    return df
@@ -1,19 +1,85 @@
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import Future
+from contextlib import asynccontextmanager
+from collections import deque
+from itertools import islice
+from typing import AsyncIterator, Awaitable, Callable, NamedTuple
+from selectolax.lexbor import LexborHTMLParser
 from selectolax.parser import HTMLParser
-from time import time
+from scheduler import HostScheduler, SchedulingTransport, parse_retry_after
+from http_cache import DEFAULT_HTTP_CACHE_DIR, CachingTransport
+from parse_executor import ParseExecutor
+from film_cache import FilmCache
+from schema import DETAIL_COLUMNS, apply_schema
+from storage import CrawlCheckpoint
+import metrics
 import pandas as pd
 import backoff
 import httpx
+import threading
 import asyncio
+import os
 
 
-def get_total_pages(username: str) -> int:
-    url = f"https://letterboxd.com/{username}/films/diary/"
+# Overridable to crawl a local replay of letterboxd (see replay_server.py)
+BASE_URL = os.environ.get("LETTERBOARD_BASE_URL", "https://letterboxd.com")
 
-    response = httpx.get(url, verify=False)
-    response.raise_for_status()
+# Requests currently in flight, shared by every crawl of the process (each Streamlit
+# session runs its own event loop, hence thread-safe futures rather than asyncio ones)
+_inflight: dict[str, Future] = {}
+_inflight_lock = threading.Lock()
+
+# Result of a request whose leader was cancelled, telling its followers to run it themselves
+_LEADER_CANCELLED = object()
+
+
+def make_client(scheduler: HostScheduler | None = None,
+                http_cache_dir: str | None = DEFAULT_HTTP_CACHE_DIR) -> httpx.AsyncClient:
+    """ Create the pooled HTTP/2 client used to crawl letterboxd, meant to be long-lived.
+        Requests sent to the network go through the scheduler, and responses are cached on disk
+        in http_cache_dir, unless it is None.
+    """
+    scheduler = scheduler or HostScheduler()
+    limits = scheduler.limits()
+    limits.keepalive_expiry = 60.0
+
+    transport = httpx.AsyncHTTPTransport(http2=True, limits=limits)
+    transport = SchedulingTransport(transport, scheduler)
+    if http_cache_dir is not None:
+        transport = CachingTransport(transport, http_cache_dir)
+
+    return httpx.AsyncClient(transport=transport, timeout=10.0)
+
+
+@asynccontextmanager
+async def _crawl_resources(client: httpx.AsyncClient | None, cache: FilmCache | None,
+                           scheduler: HostScheduler | None, executor: ParseExecutor | None):
+    """ Use the given client, film cache, scheduler and parse executor, creating (and closing) the missing ones """
+    scheduler = scheduler or HostScheduler()
+    own_cache = cache is None
+    cache = cache or FilmCache()
+    own_executor = executor is None
+    executor = executor or ParseExecutor()
 
-    parser = HTMLParser(response.text)
+    try:
+        if client is None:
+            async with make_client(scheduler) as client:
+                yield client, cache, scheduler, executor
+        else:
+            yield client, cache, scheduler, executor
+    finally:
+        if own_cache:
+            cache.close()
+        if own_executor:
+            executor.close()
+
+
+def diary_url(username: str, page: int = 1) -> str:
+    return f"{BASE_URL}/{username}/films/diary/page/{page}/"
+
+
+def parse_total_pages(content: str) -> int:
+    """ Parse the number of pages of the diary from any of its pages """
+    parser = HTMLParser(content)
     pages = parser.css("li.paginate-page")
 
     if pages:
@@ -23,12 +89,57 @@ def get_total_pages(username: str) -> int:
     return 1
 
 
-@backoff.on_exception(backoff.expo, (httpx.HTTPStatusError, httpx.RequestError), max_tries=5, jitter=None)
-async def fetch_page(client: httpx.AsyncClient, url: str) -> str:
-    """ Fetch a single page of the diary asynchronously """
-    response = await client.get(url, timeout=10.0, )
+# Attempts of a request, and the exponential backoff between them (in seconds, before jitter)
+MAX_TRIES = 5
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+
+
+def is_retryable(error: httpx.HTTPError) -> bool:
+    """ Connection errors, timeouts, 429 and 5xx may succeed later, other 4xx never will """
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        return status == 429 or status >= 500
+    return isinstance(error, httpx.RequestError)
+
+
+async def _fetch_once(client: httpx.AsyncClient, url: str) -> httpx.Response:
+    kind = metrics.page_kind(url)
+    try:
+        response = await client.get(url, timeout=10.0, )
+    except httpx.RequestError:
+        metrics.fetch_responses.inc(kind=kind, status="error")
+        raise
+
+    metrics.fetch_responses.inc(kind=kind, status=str(response.status_code))
+    metrics.fetch_bytes.observe(len(response.content), kind=kind)
     response.raise_for_status()
-    return response.text
+    return response
+
+
+async def fetch_page(client: httpx.AsyncClient, url: str, scheduler: HostScheduler | None = None) -> str:
+    """ Fetch a single page of the diary asynchronously, through the scheduler of the client (see make_client).
+        Retryable errors are retried with exponential backoff and full jitter, waiting at least as long
+        as a Retry-After header asks, while the retry budget of the scheduler for the host lasts.
+    """
+    delays = backoff.expo(base=2, factor=BACKOFF_BASE, max_value=BACKOFF_MAX)
+    next(delays)  # the generator starts with an unused None
+
+    for attempt in range(1, MAX_TRIES + 1):
+        try:
+            response = await _fetch_once(client, url)
+            return response.text
+        except httpx.HTTPError as e:
+            if attempt == MAX_TRIES or not is_retryable(e):
+                raise
+            if scheduler is not None and not scheduler.allow_retry(url):
+                raise
+
+            delay = backoff.full_jitter(next(delays))
+            if isinstance(e, httpx.HTTPStatusError):
+                delay = max(delay, parse_retry_after(e.response) or 0.0)
+            metrics.fetch_retries.inc(kind=metrics.page_kind(url))
+            await asyncio.sleep(delay)
 
 
 def parse_content(content: str) -> pd.DataFrame:
@@ -53,52 +164,127 @@ def parse_content(content: str) -> pd.DataFrame:
     )
 
 
-async def fetch_film_details(client: httpx.AsyncClient, film_url: str, executor: ThreadPoolExecutor) -> dict:
-    """ Fetch the details of a single film asynchronously """
-    full_url = f"https://letterboxd.com{film_url}"
-    content = await fetch_page(client, full_url)
-
-    # Parse the film details in a separate thread
-    loop = asyncio.get_event_loop()
-    details = await loop.run_in_executor(executor, parse_film_details, content)
-
-    return details
+async def single_flight(key: str, func: Callable[[], Awaitable]):
+    """ Run func() once for concurrent callers sharing the same key, the others await its result.
+        A cancelled leader does not pass its cancellation on: one of its followers runs func() instead.
+    """
+    while True:
+        with _inflight_lock:
+            future = _inflight.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = _inflight[key] = Future()
+
+        if is_leader:
+            break
+        # Shielded so that a cancelled follower does not cancel the shared future
+        result = await asyncio.shield(asyncio.wrap_future(future))
+        if result is not _LEADER_CANCELLED:
+            return result
+
+    # The key is released before the future is resolved, so that a follower running func() again leads
+    try:
+        result = await func()
+    except asyncio.CancelledError:
+        _release(key)
+        future.set_result(_LEADER_CANCELLED)
+        raise
+    except BaseException as e:
+        _release(key)
+        future.set_exception(e)
+        raise
+    _release(key)
+    future.set_result(result)
+    return result
+
+
+def _release(key: str) -> None:
+    with _inflight_lock:
+        del _inflight[key]
+
+
+async def fetch_film_details(client: httpx.AsyncClient, film_url: str, executor: ParseExecutor,
+                             cache: FilmCache | None = None, scheduler: HostScheduler | None = None) -> dict:
+    """ Fetch the details of a single film asynchronously, from the film cache when it is fresh """
+    if cache is not None:
+        details = await asyncio.to_thread(cache.get, film_url)
+        if details is not None:
+            return details
+
+    async def fetch_and_parse() -> dict:
+        full_url = f"{BASE_URL}{film_url}"
+        content = await fetch_page(client, full_url, scheduler)
+
+        # Parse the film details off the event loop
+        details = await executor.parse(parse_film_details, content)
+
+        if cache is not None:
+            await asyncio.to_thread(cache.set, film_url, details)
+
+        return details
+
+    # Rewatches and concurrent sessions share a single request per film
+    return await single_flight(film_url, fetch_and_parse)
+
+
+# Links of a film page holding its details, recognised by a part of their href
+_COUNTRY_HREF = "/films/country/"
+_STUDIO_HREF = "/studio/"
+_LANGUAGE_HREF = "/films/language/"
+_GENRE_HREF = "/films/genre/"
+_DIRECTOR_HREF = "/director/"
+_ACTOR_HREF = "/actor/"
+
+# A single selector list matching only the detail links. They are returned grouped by
+# selector, each group in document order, so the first link of each kind is still found first.
+_DETAIL_LINKS = ", ".join(
+    f"a[href*='{href}']"
+    for href in (_COUNTRY_HREF, _STUDIO_HREF, _LANGUAGE_HREF, _GENRE_HREF, _DIRECTOR_HREF, _ACTOR_HREF)
+)
 
 
 def parse_film_details(content: str) -> dict:
-    """ Parse the film details from the film page """
-    parser = HTMLParser(content)
-
-    country = parser.css_first("a[href*='/films/country/']").text(
-    ) if parser.css_first("a[href*='/films/country/']") else None
-    studio = parser.css_first(
-        "a[href*='/studio/']").text() if parser.css_first("a[href*='/studio/']") else None
-    primary_language = parser.css_first("a[href*='/films/language/']").text(
-    ) if parser.css_first("a[href*='/films/language/']") else None
-
-    genres = parser.css(
-        "a[href*='/films/genre/']") if parser.css("a[href*='/films/genre/']") else None
-    genres = [genre.text() for genre in genres] if genres else []
-
-    director = parser.css_first(
-        "a[href*='/director/']").text() if parser.css_first("a[href*='/director/']") else None
-
-    actors = parser.css("a[href*='/actor/']") if parser.css(
-        "a[href*='/actor/']") else None
-    actors = [actor.text() for actor in actors] if actors else []
-
-    running_time = parser.css_first("p[class*='text-link']").text() if parser.css_first(
-        "p[class*='text-link']") else None
-    running_time = [char for char in running_time.split()[0]
-                    if char.isdigit()] if running_time else None
-    running_time = int("".join(map(str, running_time))
-                       ) if running_time else None
+    """ Parse the film details from the film page.
+        The detail links are collected in a single query and dispatched on their href,
+        the first matching link giving the single-valued fields.
+        Film pages are large, so they go through the lexbor backend, which builds the tree much faster.
+    """
+    parser = LexborHTMLParser(content)
+
+    country = studio = primary_language = director = None
+    genres = []
+    actors = []
+
+    for link in parser.css(_DETAIL_LINKS):
+        href = link.attributes["href"]
+
+        if _ACTOR_HREF in href:
+            actors.append(link.text())
+        if _GENRE_HREF in href:
+            genres.append(link.text())
+        if country is None and _COUNTRY_HREF in href:
+            country = link.text()
+        if studio is None and _STUDIO_HREF in href:
+            studio = link.text()
+        if primary_language is None and _LANGUAGE_HREF in href:
+            primary_language = link.text()
+        if director is None and _DIRECTOR_HREF in href:
+            director = link.text()
+
+    running_time = None
+    running_time_node = parser.css_first("p[class*='text-link']")
+    if running_time_node is not None:
+        running_time_text = running_time_node.text().split()
+        digits = "".join(char for char in running_time_text[0]
+                         if char.isdigit()) if running_time_text else ""
+        running_time = int(digits) if digits else None
 
     # get "content" attribute value from meta tag whose name is "twitter:data2"
-    average_rating = parser.css_first(
-        "meta[name='twitter:data2']").attrs["content"] if parser.css_first("meta[name='twitter:data2']") else None
-    average_rating = float(average_rating.split(
-        " ")[0]) if average_rating else None
+    average_rating = None
+    average_rating_node = parser.css_first("meta[name='twitter:data2']")
+    if average_rating_node is not None and average_rating_node.attributes.get("content"):
+        average_rating = float(average_rating_node.attributes["content"].split(" ")[0])
+
     return {
         "country": country,
         "studio": studio,
@@ -111,31 +297,265 @@ def parse_film_details(content: str) -> dict:
     }
 
 
-async def fetch_data(client: httpx.AsyncClient, username: str, page: int, executor: ThreadPoolExecutor) -> pd.DataFrame:
-    """ Fetch the data for a single page of the diary """
-    url = f"https://letterboxd.com/{username}/films/diary/page/{page}/"
-    content = await fetch_page(client, url)
+async def fetch_diary_page(client: httpx.AsyncClient, username: str, page: int, executor: ParseExecutor,
+                           scheduler: HostScheduler | None = None) -> pd.DataFrame:
+    """ Fetch and parse a single page of the diary, without the film details """
+    content = await fetch_page(client, diary_url(username, page), scheduler)
+
+    return await executor.parse(parse_content, content)
 
-    loop = asyncio.get_event_loop()
-    df = await loop.run_in_executor(executor, parse_content, content)
 
-    # Fetch film details for each film on the page
+async def add_film_details(client: httpx.AsyncClient, df: pd.DataFrame, executor: ParseExecutor,
+                           cache: FilmCache | None = None, scheduler: HostScheduler | None = None) -> pd.DataFrame:
+    """ Fetch the film details of every diary entry and add them as columns.
+        Entries whose film failed to fetch are left out, their urls listed in attrs["missing_films"].
+    """
     film_details_tasks = [
-        fetch_film_details(client, film_url, executor)
+        fetch_film_details(client, film_url, executor, cache, scheduler)
         for film_url in df["url"]
     ]
     details_list = await asyncio.gather(*film_details_tasks, return_exceptions=True)
 
-    details_df = pd.DataFrame(details_list)
-    combined_df = pd.concat([df, details_df], axis=1)
-    return combined_df.dropna()
-
-
-async def main(username: str, total_pages: int) -> pd.DataFrame:
-    async with httpx.AsyncClient() as client:
-        with ThreadPoolExecutor() as executor:
-            tasks = [fetch_data(client, username, page, executor)
-                     for page in range(1, total_pages + 1)]
-            results = await asyncio.gather(*tasks)
-
-    return pd.concat(results, ignore_index=True)
+    with metrics.stage_seconds.time(stage="assemble"):
+        failed = [isinstance(details, BaseException) for details in details_list]
+        details_df = pd.DataFrame([{} if is_failed else details for details, is_failed in zip(details_list, failed)],
+                                  index=df.index, columns=DETAIL_COLUMNS)
+        # Only the details decide: the diary columns of an already typed diary hold NaN (e.g. no rating)
+        combined_df = pd.concat([df, details_df], axis=1).dropna(subset=DETAIL_COLUMNS)
+        combined_df.attrs["missing_films"] = list(df["url"][failed])
+        return combined_df
+
+
+class PageResult(NamedTuple):
+    """ A diary page with its film details, and the progress of the crawl when it completed.
+        In a partial crawl, a page that failed comes with its error and an empty frame.
+    """
+    page: int
+    df: pd.DataFrame
+    done: int
+    total: int
+    missing_films: list[str] = []
+    error: BaseException | None = None
+
+
+async def stream_main(username: str, total_pages: int | None = None, cache: FilmCache | None = None,
+                      scheduler: HostScheduler | None = None, client: httpx.AsyncClient | None = None,
+                      executor: ParseExecutor | None = None, checkpoint: CrawlCheckpoint | None = None,
+                      partial: bool = False, film_details: bool = True) -> AsyncIterator[PageResult]:
+    """ Crawl the diary and yield each page as soon as it and its film details are fetched.
+        Without total_pages, the number of pages is read from the first page, which the crawl then reuses.
+
+        Pages complete with all their films are saved to the checkpoint, and pages already in it are
+        yielded without being fetched again. The first page is always fetched with a checkpoint: its
+        newest entry tells whether new entries shifted the checkpointed pages.
+        Without partial, the first failing page stops the crawl.
+        Without film_details, only the diary pages are fetched (see enrich_stream), and none is checkpointed.
+    """
+    if not film_details:
+        checkpoint = None
+
+    async with _crawl_resources(client, cache, scheduler, executor) as (client, cache, scheduler, executor):
+        # Only a few pages fan out to their film details at once, which bounds the
+        # number of pending tasks and parsed pages held in memory
+        pages_in_flight = asyncio.Semaphore(scheduler.config.max_pages_in_flight)
+
+        first_page = None
+        if total_pages is None or checkpoint is not None:
+            with metrics.stage_seconds.time(stage="total_pages"):
+                content = await fetch_page(client, diary_url(username), scheduler)
+                total_pages = total_pages or parse_total_pages(content)
+            first_page = await executor.parse(parse_content, content)
+
+        checkpointed = set()
+        if checkpoint is not None:
+            newest_entry = _entry_keys(first_page).iloc[0] if not first_page.empty else ""
+            checkpointed = await asyncio.to_thread(checkpoint.start, total_pages, newest_entry)
+
+        async def fetch_data_bounded(page: int) -> PageResult:
+            try:
+                # A checkpointed page that cannot be read back is fetched again
+                if page in checkpointed:
+                    df = await asyncio.to_thread(checkpoint.load_page, page)
+                    if df is not None:
+                        return PageResult(page, df, 0, total_pages)
+
+                async with pages_in_flight:
+                    if page == 1 and first_page is not None:
+                        df = first_page
+                    else:
+                        df = await fetch_diary_page(client, username, page, executor, scheduler)
+                    if film_details:
+                        df = await add_film_details(client, df, executor, cache, scheduler)
+            except Exception as e:
+                if not partial:
+                    raise
+                return PageResult(page, pd.DataFrame(), 0, total_pages, error=e)
+
+            missing_films = df.attrs.get("missing_films", [])
+            df = apply_schema(df)
+            if checkpoint is not None and not missing_films:
+                await asyncio.to_thread(checkpoint.save_page, page, df)
+            return PageResult(page, df, 0, total_pages, missing_films)
+
+        tasks = [asyncio.create_task(fetch_data_bounded(page))
+                 for page in range(1, total_pages + 1)]
+        try:
+            for done, task in enumerate(asyncio.as_completed(tasks), start=1):
+                result = await task
+                yield result._replace(done=done)
+        finally:
+            # The consumer stopped early or a page failed: stop the remaining pages
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+# Diary entries whose film details are yielded together when a diary is enriched after its pages,
+# and chunks fetched at the same time: the next chunk starts as soon as the oldest one is yielded
+ENRICH_CHUNK_SIZE = 50
+ENRICH_CHUNKS_IN_FLIGHT = 4
+
+
+class EnrichResult(NamedTuple):
+    """ Entries of the diary with their film details, and the progress of the enrichment.
+        Entries whose film failed to fetch are left out, their urls listed in missing_films.
+    """
+    df: pd.DataFrame
+    done: int
+    total: int
+    missing_films: list[str] = []
+
+
+async def enrich_stream(df: pd.DataFrame, cache: FilmCache | None = None, scheduler: HostScheduler | None = None,
+                        client: httpx.AsyncClient | None = None, executor: ParseExecutor | None = None,
+                        chunk_size: int = ENRICH_CHUNK_SIZE,
+                        chunks_in_flight: int = ENRICH_CHUNKS_IN_FLIGHT) -> AsyncIterator[EnrichResult]:
+    """ Second phase of a crawl: add the film details to a diary fetched without them, chunk by chunk
+        in diary order, so that they can be shown progressively.
+
+        Chunks are fetched over a sliding window of chunks_in_flight chunks, so that the slowest films
+        of a chunk do not hold the requests of the next ones back.
+    """
+    async with _crawl_resources(client, cache, scheduler, executor) as (client, cache, scheduler, executor):
+        starts = iter(range(0, len(df), chunk_size))
+        window: deque[tuple[int, asyncio.Task]] = deque()
+        try:
+            while True:
+                for start in islice(starts, chunks_in_flight - len(window)):
+                    chunk = df.iloc[start:start + chunk_size]
+                    task = asyncio.create_task(add_film_details(client, chunk, executor, cache, scheduler))
+                    window.append((start + len(chunk), task))
+                if not window:
+                    return
+
+                done, task = window.popleft()
+                enriched = await task
+                yield EnrichResult(apply_schema(enriched), done, len(df), enriched.attrs["missing_films"])
+        finally:
+            for _, task in window:
+                task.cancel()
+            # Awaited so that no fetch outlives the enrichment
+            await asyncio.gather(*(task for _, task in window), return_exceptions=True)
+
+
+class CrawlResult(NamedTuple):
+    """ Diary of a partial crawl, and what it is missing """
+    df: pd.DataFrame
+    missing_pages: list[int]
+    missing_films: list[str]
+
+    @property
+    def complete(self) -> bool:
+        return not self.missing_pages and not self.missing_films
+
+
+async def crawl(username: str, total_pages: int | None = None, cache: FilmCache | None = None,
+                scheduler: HostScheduler | None = None, client: httpx.AsyncClient | None = None,
+                executor: ParseExecutor | None = None, resume: bool = True) -> CrawlResult:
+    """ Crawl the diary, returning what could be fetched when pages or films fail.
+        Completed pages are checkpointed: an incomplete crawl resumes with what it missed on the
+        next call, and the checkpoint is dropped once the diary is complete.
+    """
+    checkpoint = CrawlCheckpoint(username) if resume else None
+    results: dict[int, pd.DataFrame] = {}
+    missing_pages = []
+    missing_films = []
+    async for result in stream_main(username, total_pages, cache, scheduler, client, executor,
+                                    checkpoint, partial=True):
+        results[result.page] = result.df
+        missing_films += result.missing_films
+        if result.error is not None:
+            missing_pages.append(result.page)
+
+    df = apply_schema(pd.concat([results[page] for page in sorted(results)], ignore_index=True))
+    result = CrawlResult(df, sorted(missing_pages), missing_films)
+    if checkpoint is not None and result.complete:
+        await asyncio.to_thread(checkpoint.clear)
+    return result
+
+
+async def main(username: str, total_pages: int | None = None, cache: FilmCache | None = None,
+               scheduler: HostScheduler | None = None, client: httpx.AsyncClient | None = None,
+               executor: ParseExecutor | None = None, resume: bool = False) -> pd.DataFrame:
+    """ Crawl the whole diary, failing on the first page that fails.
+        With resume, completed pages are checkpointed and a failed crawl resumes from them on the next call.
+    """
+    checkpoint = CrawlCheckpoint(username) if resume else None
+    results = {}
+    async for result in stream_main(username, total_pages, cache, scheduler, client, executor, checkpoint):
+        results[result.page] = result.df
+
+    df = pd.concat([results[page] for page in sorted(results)], ignore_index=True)
+    if checkpoint is not None:
+        await asyncio.to_thread(checkpoint.clear)
+    return apply_schema(df)
+
+
+def _entry_keys(df: pd.DataFrame) -> pd.Series:
+    """ Identify diary entries by film url and viewing date """
+    log_dates = pd.to_datetime(df["log_date"]).dt.strftime("%Y-%m-%d")
+    return df["url"].astype(str) + "@" + log_dates
+
+
+async def sync(username: str, stored: pd.DataFrame | None, cache: FilmCache | None = None,
+               scheduler: HostScheduler | None = None, client: httpx.AsyncClient | None = None,
+               executor: ParseExecutor | None = None) -> pd.DataFrame:
+    """ Fetch only the diary entries logged since the stored diary and merge them into it.
+        New entries whose film failed to fetch are left out, their urls listed in attrs["missing_films"].
+
+        The diary is sorted newest first, so pages are walked from the first one and the walk
+        stops on the first page containing an entry that is already stored, or older than the
+        newest stored entry. The new entries come first in the merged diary.
+    """
+    if stored is None or stored.empty:
+        return await main(username, None, cache, scheduler, client, executor)
+
+    known_keys = set(_entry_keys(stored))
+    newest_log_date = pd.to_datetime(stored["log_date"]).max()
+
+    async with _crawl_resources(client, cache, scheduler, executor) as (client, cache, scheduler, executor):
+        new_entries = []
+        page = 1
+        while True:
+            df = await fetch_diary_page(client, username, page, executor, scheduler)
+            if df.empty:
+                break
+
+            is_known = _entry_keys(df).isin(known_keys)
+            new_entries.append(df[~is_known])
+
+            reached_stored = is_known.any() or (
+                pd.to_datetime(df["log_date"]) < newest_log_date).any()
+            if reached_stored:
+                break
+            page += 1
+
+        delta = pd.concat(new_entries, ignore_index=True) if new_entries else pd.DataFrame()
+        if delta.empty:
+            return apply_schema(stored)
+        delta = await add_film_details(client, delta, executor, cache, scheduler)
+
+    # Categories differ between the two diaries, the schema is applied again on the merged one
+    merged = apply_schema(pd.concat([apply_schema(delta), apply_schema(stored)], ignore_index=True))
+    merged.attrs["missing_films"] = delta.attrs["missing_films"]
+    return merged
@@ -0,0 +1,147 @@
+from scheduler import HostScheduler, SchedulerConfig
+from parse_executor import ParseExecutor
+from batch import MAX_USERS_IN_FLIGHT, crawl_user, print_reports, read_usernames
+from scrapper import _crawl_resources
+from storage import is_valid_username
+from dataclasses import replace
+from typing import Iterator
+from time import perf_counter
+import multiprocessing
+import argparse
+import asyncio
+import queue
+import math
+import sys
+import os
+
+
+def split_budget(config: SchedulerConfig, workers: int) -> SchedulerConfig:
+    """ Share the request budget of a host between the workers, which each schedule their own requests """
+    return replace(
+        config,
+        max_concurrency=max(1, math.ceil(config.max_concurrency / workers)),
+        initial_rate=config.initial_rate / workers,
+        min_rate=config.min_rate / workers,
+        max_rate=config.max_rate / workers,
+        burst=max(1.0, config.burst / workers),
+        retry_burst=max(1.0, config.retry_burst / workers),
+    )
+
+
+async def _work(work, results, scheduler_config: SchedulerConfig, max_users_in_flight: int,
+                incremental: bool) -> None:
+    # The worker process is the unit of parallelism, its pages are parsed inline on its own loop
+    scheduler = HostScheduler(scheduler_config)
+    executor = ParseExecutor("inline")
+
+    async with _crawl_resources(None, None, scheduler, executor) as (client, cache, scheduler, executor):
+        async def consume() -> None:
+            while True:
+                username = await asyncio.to_thread(work.get)
+                if username is None:
+                    return
+                results.put(await crawl_user(username, client, cache, scheduler, executor, incremental))
+
+        await asyncio.gather(*(consume() for _ in range(max_users_in_flight)))
+
+
+def _worker(work, results, scheduler_config: SchedulerConfig, max_users_in_flight: int,
+            incremental: bool) -> None:
+    asyncio.run(_work(work, results, scheduler_config, max_users_in_flight, incremental))
+
+
+def sharded_crawl(usernames: list[str], workers: int | None = None,
+                  max_users_in_flight: int = MAX_USERS_IN_FLIGHT, incremental: bool = True,
+                  scheduler_config: SchedulerConfig | None = None) -> Iterator[dict]:
+    """ Crawl the diaries of many users over worker processes, yielding each report as soon as it arrives.
+
+        Usernames are pulled from a shared work queue, so a worker stuck on a large diary does not
+        hold back the others. Every worker runs its own event loop and client, and gets an equal share
+        of the request budget of scheduler_config, so that the workers together stay within it.
+    """
+    usernames = list(dict.fromkeys(usernames))
+    workers = max(1, min(workers or os.cpu_count(), len(usernames)))
+    scheduler_config = split_budget(scheduler_config or SchedulerConfig(), workers)
+
+    # Spawned rather than forked, as the parse executor
+    context = multiprocessing.get_context("spawn")
+    work = context.Queue()
+    results = context.Queue()
+
+    for username in usernames:
+        work.put(username)
+    # One stop signal per consumer of every worker
+    for _ in range(workers * max_users_in_flight):
+        work.put(None)
+
+    processes = [
+        context.Process(target=_worker, name=f"crawl-worker-{i}",
+                        args=(work, results, scheduler_config, max_users_in_flight, incremental))
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    pending = set(usernames)
+    workers_exited = False
+    try:
+        while pending:
+            try:
+                report = results.get(timeout=1.0)
+            except queue.Empty:
+                if any(process.is_alive() for process in processes):
+                    continue
+                if not workers_exited:
+                    # Reports sent just before the workers exited may still be in the pipe
+                    workers_exited = True
+                    continue
+                # Every worker exited without reporting these users: a worker crashed
+                for username in sorted(pending):
+                    yield {"username": username, "status": "failed", "entries": 0, "new_entries": 0,
+                           "error": "worker process exited", "missing_pages": [], "missing_films": [],
+                           "time_s": 0.0}
+                return
+
+            pending.discard(report["username"])
+            yield report
+    finally:
+        for process in processes:
+            if pending:
+                process.terminate()
+            process.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Crawl the diaries of many letterboxd users over several processes and store them")
+    parser.add_argument("usernames", nargs="*")
+    parser.add_argument("--from-file", action="append", default=[], metavar="PATH",
+                        help="file with one username per line, '-' for stdin")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--max-users", type=int, default=MAX_USERS_IN_FLIGHT,
+                        help="number of users crawled at the same time by each worker")
+    parser.add_argument("--full", action="store_true",
+                        help="crawl the whole diaries instead of the entries logged since the last crawl")
+    parser.add_argument("--rate", type=float,
+                        help="maximum number of requests per second to letterboxd, shared by every worker")
+    parser.add_argument("--json", action="store_true", help="print the reports as JSON")
+    args = parser.parse_args()
+
+    usernames = args.usernames + read_usernames(args.from_file)
+    if not usernames:
+        parser.error("no usernames given")
+    invalid = [username for username in usernames if not is_valid_username(username)]
+    if invalid:
+        parser.error(f"invalid usernames: {', '.join(invalid)}")
+
+    scheduler_config = SchedulerConfig().capped(args.rate) if args.rate else SchedulerConfig()
+    start = perf_counter()
+    reports = []
+    for report in sharded_crawl(usernames, args.workers, args.max_users, not args.full, scheduler_config):
+        print(f"{report['username']}: {report['status']}, {report['new_entries']} new entries "
+              f"in {report['time_s']}s", file=sys.stderr)
+        reports.append(report)
+    elapsed = perf_counter() - start
+
+    failed = print_reports(reports, elapsed, args.json)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,114 @@
+from dataclasses import dataclass
+from schema import DETAIL_COLUMNS, LIST_COLUMNS
+import pandas as pd
+import numpy as np
+import hashlib
+
+
+# Half-star bins of the rating histogram, ratings being out of 5
+RATING_BINS = [0.5, 1, 1.5, 2, 2.5, 3, 3.5, 4, 4.5, 5, 5.5]
+
+
+@dataclass
+class ProfileStats:
+    """ Aggregates of a diary shared by every chart, computed once per dataset """
+    key: str                            # dataset version key, see dataset_key
+    total_films: int
+    has_film_details: bool              # False for a diary without its film details yet, see DETAIL_COLUMNS
+    director_counts: pd.Series
+    actor_counts: pd.Series
+    genre_counts: pd.Series
+    country_counts: pd.Series
+    language_counts: pd.Series
+    studio_counts: pd.Series
+    studio_ratings: pd.DataFrame        # mean user rating and letterboxd average rating per studio
+    decade_counts: pd.Series
+    monthly_log_counts: pd.DataFrame    # year_month, counts
+    rating_histogram: np.ndarray        # number of films per bin of RATING_BINS
+    country_language_links: pd.DataFrame  # country, primary_language, count
+
+
+def _value_counts(values: pd.Series) -> pd.Series:
+    """ Counts sorted in decreasing order, with plain string labels and integer counts """
+    counts = values.value_counts()
+    counts = counts[counts > 0]
+    return pd.Series(counts.to_numpy(dtype="int64"),
+                     index=pd.Index(counts.index.astype(str), name=values.name), name="count")
+
+
+def mode(counts: pd.Series) -> str:
+    """ Most frequent label, the first one in alphabetical order on ties (as Series.mode) """
+    return min(counts.index[counts == counts.max()])
+
+
+def dataset_key(username: str, df: pd.DataFrame) -> str:
+    """ Version key of the diary of a user: the username and a fingerprint of the content.
+        Computed once per fetch, it stands for the whole frame in the chart caches.
+    """
+    hashes = [pd.util.hash_pandas_object(df.drop(columns=LIST_COLUMNS, errors="ignore"), index=False)]
+    for column in LIST_COLUMNS:
+        if column in df:
+            joined = df[column].map(lambda names: "\x1f".join(names) if names is not None else "")
+            hashes.append(pd.util.hash_pandas_object(joined, index=False))
+
+    digest = hashlib.blake2b(digest_size=16)
+    for values in hashes:
+        digest.update(values.to_numpy().tobytes())
+    return f"{username.lower()}:{digest.hexdigest()}"
+
+
+def compute_profile_stats(df: pd.DataFrame, key: str) -> ProfileStats:
+    """ Compute every aggregate drawn on the dashboard in a single pass over the diary.
+        Works on typed diaries (see schema.py) as well as on raw scraped pages.
+        key identifies the diary in the chart caches (see dataset_key).
+        Without the film details, the aggregates of the detail columns are empty.
+    """
+    has_film_details = all(column in df for column in DETAIL_COLUMNS)
+    if not has_film_details:
+        df = df.assign(**{column: None for column in DETAIL_COLUMNS if column not in df})
+
+    # Diary ratings are out of 10 (half stars)
+    ratings = pd.to_numeric(df["rating"], errors="coerce").astype(float) / 2
+    log_dates = pd.to_datetime(df["log_date"])
+    years = pd.to_numeric(df["date"], errors="coerce")
+
+    actor_counts = _value_counts(df["actors"].explode())
+    genre_counts = _value_counts(df["genres"].explode())
+
+    studios = df["studio"].astype(object)
+    studio_ratings = pd.DataFrame({
+        "rating": ratings.groupby(studios).mean(),
+        "avg_rating": pd.to_numeric(df["average_rating"], errors="coerce").groupby(studios).mean(),
+    })
+    studio_ratings.index = studio_ratings.index.astype(str)
+
+    decade_counts = (years // 10 * 10).dropna().astype(int).value_counts().sort_index()
+
+    monthly_log_counts = log_dates.dt.to_period("M").astype(str).value_counts().sort_index()
+    monthly_log_counts = monthly_log_counts.rename_axis("year_month").reset_index(name="counts")
+
+    rating_histogram, _ = np.histogram(ratings.dropna(), bins=RATING_BINS)
+
+    country_language_links = (
+        df.groupby(["country", "primary_language"], observed=True).size()
+        .reset_index(name="count")
+    )
+    country_language_links["country"] = country_language_links["country"].astype(str)
+    country_language_links["primary_language"] = country_language_links["primary_language"].astype(str)
+
+    return ProfileStats(
+        key=key,
+        total_films=df.shape[0],
+        has_film_details=has_film_details,
+        director_counts=_value_counts(df["director"]),
+        actor_counts=actor_counts,
+        genre_counts=genre_counts,
+        country_counts=_value_counts(df["country"]),
+        language_counts=_value_counts(df["primary_language"]),
+        studio_counts=_value_counts(df["studio"]),
+        studio_ratings=studio_ratings,
+        decade_counts=decade_counts,
+        monthly_log_counts=monthly_log_counts,
+        rating_histogram=rating_histogram,
+        country_language_links=country_language_links,
+    )
@@ -0,0 +1,205 @@
+from schema import CATEGORY_COLUMNS, LIST_COLUMNS, apply_schema
+from time import time, time_ns
+from uuid import uuid4
+import pyarrow.parquet as pq
+import pyarrow as pa
+import pandas as pd
+import argparse
+import shutil
+import json
+import ast
+import re
+import os
+
+
+DATA_DIR = os.environ.get("LETTERBOARD_DATA_DIR", "data")
+
+# Number of appended parts after which a diary is rewritten as a single file
+MAX_PARTS = 8
+
+# Pages of an interrupted crawl are reused for this long, in seconds: past it the diary may have shifted
+CHECKPOINT_TTL = 60 * 60 * 6
+
+# Letterboxd usernames, which name the directories of the store
+USERNAME_PATTERN = re.compile(r"[A-Za-z0-9_]+")
+
+
+def is_valid_username(username: str) -> bool:
+    return USERNAME_PATTERN.fullmatch(username) is not None
+
+
+def check_username(username: str) -> str:
+    """ Return username, raising ValueError if it is not a Letterboxd username, which could point
+        a path of the store outside of DATA_DIR
+    """
+    if not is_valid_username(username):
+        raise ValueError(f"Invalid username '{username}': only letters, digits and underscores are allowed")
+    return username
+
+
+def diary_dir(username: str) -> str:
+    """ Directory of the stored diary of a user, one Parquet file per saved or appended part """
+    return os.path.join(DATA_DIR, check_username(username).lower())
+
+
+def _parts(username: str) -> list[str]:
+    directory = diary_dir(username)
+    if not os.path.isdir(directory):
+        return []
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                  if name.endswith(".parquet"))
+
+
+def _to_table(df: pd.DataFrame) -> pa.Table:
+    # Categories are stored as plain strings, Parquet dictionary-encodes them anyway and
+    # the parts of a diary would otherwise disagree on their dictionary types
+    df = df.copy()
+    for column in CATEGORY_COLUMNS:
+        if column in df:
+            df[column] = df[column].astype(object)
+    # Without the pandas metadata: pandas cannot read back the Arrow list dtypes it records there,
+    # and the columns are typed again by apply_schema on load anyway
+    return pa.Table.from_pandas(df, preserve_index=False).replace_schema_metadata(None)
+
+
+def _to_df(table: pa.Table) -> pd.DataFrame:
+    # The metadata is ignored rather than trusted, for the parts written before it was dropped
+    df = table.to_pandas(ignore_metadata=True,
+                         types_mapper=lambda t: pd.ArrowDtype(t) if pa.types.is_list(t) else None)
+    return apply_schema(df)
+
+
+def _temp_path(path: str) -> str:
+    # Unique, as several processes (the workers of a sharded crawl) may write the same file at once
+    return f"{path}.{uuid4().hex}.tmp"
+
+
+def _write_part(username: str, df: pd.DataFrame) -> None:
+    directory = diary_dir(username)
+    os.makedirs(directory, exist_ok=True)
+
+    # Parts are named by time so that they load oldest first, and written to a
+    # temporary file first so that a crash never leaves a truncated part
+    path = os.path.join(directory, f"part-{time_ns()}.parquet")
+    temp_path = _temp_path(path)
+    pq.write_table(_to_table(df), temp_path, compression="zstd")
+    os.replace(temp_path, path)
+
+
+def load_diary(username: str) -> pd.DataFrame | None:
+    """ Load the stored diary of a user, or None if it was never fetched.
+        Files are memory-mapped and columns come back typed: no parsing of the stored values.
+    """
+    parts = _parts(username)
+    if not parts:
+        return None
+
+    # Newest entries first, as in the diary, and the parts are named oldest first
+    tables = [pq.read_table(path, memory_map=True, read_dictionary=CATEGORY_COLUMNS)
+              for path in reversed(parts)]
+    return _to_df(pa.concat_tables(tables))
+
+
+def save_diary(username: str, df: pd.DataFrame) -> None:
+    """ Store the diary of a user, replacing the previous one """
+    old_parts = _parts(username)
+    _write_part(username, df)
+    for path in old_parts:
+        os.remove(path)
+
+
+def append_diary(username: str, df: pd.DataFrame) -> None:
+    """ Add the entries of an incremental crawl to the stored diary of a user """
+    if df.empty:
+        return
+
+    _write_part(username, df)
+
+    # Too many small parts slow the loading down: compact them into one
+    if len(_parts(username)) > MAX_PARTS:
+        save_diary(username, load_diary(username))
+
+
+class CrawlCheckpoint:
+    """ Diary pages of a crawl in progress, stored as each one completes with its film details,
+        so that a failed or interrupted crawl of the same user resumes with the missing pages only.
+
+        Pages are numbered from the newest entries, so new entries logged in between shift them:
+        the checkpoint is dropped when the newest entry of the diary or its number of pages changed,
+        or after CHECKPOINT_TTL.
+    """
+
+    def __init__(self, username: str, ttl: float = CHECKPOINT_TTL):
+        self.directory = os.path.join(DATA_DIR, ".checkpoints", check_username(username).lower())
+        self.ttl = ttl
+
+    def _meta_path(self) -> str:
+        return os.path.join(self.directory, "crawl.json")
+
+    def _page_path(self, page: int) -> str:
+        return os.path.join(self.directory, f"page-{page}.parquet")
+
+    def _load_meta(self) -> dict | None:
+        try:
+            with open(self._meta_path()) as file:
+                meta = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if time() - meta["started_at"] > self.ttl:
+            return None
+        return meta
+
+    def start(self, total_pages: int, newest_entry: str) -> set[int]:
+        """ Start or resume the crawl of a diary of total_pages pages whose newest entry is newest_entry
+            (see scrapper._entry_keys), returning the pages already completed
+        """
+        meta = {"total_pages": total_pages, "newest_entry": newest_entry}
+        stored = self._load_meta()
+        if stored is None or any(stored.get(name) != value for name, value in meta.items()):
+            self.clear()
+            os.makedirs(self.directory, exist_ok=True)
+            temp_path = _temp_path(self._meta_path())
+            with open(temp_path, "w") as file:
+                json.dump({**meta, "started_at": time()}, file)
+            os.replace(temp_path, self._meta_path())
+            return set()
+
+        return {int(name[len("page-"):-len(".parquet")]) for name in os.listdir(self.directory)
+                if name.startswith("page-") and name.endswith(".parquet")}
+
+    def save_page(self, page: int, df: pd.DataFrame) -> None:
+        path = self._page_path(page)
+        temp_path = _temp_path(path)
+        pq.write_table(_to_table(df), temp_path)
+        os.replace(temp_path, path)
+
+    def load_page(self, page: int) -> pd.DataFrame | None:
+        """ Load a completed page, or None if it cannot be read back (missing or truncated file) """
+        try:
+            return _to_df(pq.read_table(self._page_path(page), read_dictionary=CATEGORY_COLUMNS))
+        except (OSError, ValueError, TypeError, pa.ArrowException):
+            return None
+
+    def clear(self) -> None:
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def load_csv(path: str) -> pd.DataFrame:
+    """ Load a diary exported as CSV, whose list columns were written as Python lists """
+    df = pd.read_csv(path)
+    for column in LIST_COLUMNS:
+        if column in df:
+            df[column] = df[column].map(ast.literal_eval)
+    return apply_schema(df)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Store a diary exported as CSV in the Parquet store")
+    parser.add_argument("csv_path")
+    parser.add_argument("username")
+    args = parser.parse_args()
+    if not is_valid_username(args.username):
+        parser.error(f"invalid username '{args.username}'")
+
+    save_diary(args.username, load_csv(args.csv_path))
+    print(f"Stored {args.csv_path} as the diary of '{args.username}' in {diary_dir(args.username)}")
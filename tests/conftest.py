@@ -0,0 +1,19 @@
+from replay_server import ReplayConfig, ReplayServer
+import scrapper
+import storage
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def data_dir(tmp_path, monkeypatch):
+    """ Diaries and checkpoints stored in the temporary directory of the test """
+    monkeypatch.setattr(storage, "DATA_DIR", str(tmp_path / "data"))
+    return tmp_path / "data"
+
+
+@pytest.fixture
+def replay(tmp_path, monkeypatch):
+    """ Synthetic letterboxd served locally without latency, and crawled instead of letterboxd.com """
+    with ReplayServer(str(tmp_path / "no-fixtures"), ReplayConfig(latency=0.0, jitter=0.0)) as server:
+        monkeypatch.setattr(scrapper, "BASE_URL", server.url)
+        yield server
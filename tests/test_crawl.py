@@ -0,0 +1,113 @@
+from storage import CrawlCheckpoint, load_diary, save_diary
+from scheduler import HostScheduler, SchedulerConfig
+from parse_executor import ParseExecutor
+from film_cache import FilmCache
+from batch import crawl_user
+import pandas as pd
+import scrapper
+import asyncio
+import os
+
+
+# The local replay does not need the limits protecting letterboxd
+UNTHROTTLED = SchedulerConfig(max_concurrency=64, initial_rate=10_000, max_rate=10_000, burst=10_000)
+
+
+def run(tmp_path, func, *args, **kwargs):
+    """ Run func(*args, cache, scheduler, client, executor, **kwargs) with resources of the test """
+    async def with_resources():
+        scheduler = HostScheduler(UNTHROTTLED)
+        cache = FilmCache(os.path.join(tmp_path, "films.sqlite3"))
+        executor = ParseExecutor("inline")
+        try:
+            async with scrapper.make_client(scheduler, http_cache_dir=None) as client:
+                return await func(*args, cache, scheduler, client, executor, **kwargs)
+        finally:
+            cache.close()
+            executor.close()
+
+    return asyncio.run(with_resources())
+
+
+def test_crawl_resumes_after_failed_page(tmp_path, replay, monkeypatch):
+    fetch_diary_page = scrapper.fetch_diary_page
+    failed = []
+
+    async def fail_page_3_once(client, username, page, *args):
+        if page == 3 and not failed:
+            failed.append(page)
+            raise RuntimeError("page 3 failed")
+        return await fetch_diary_page(client, username, page, *args)
+
+    monkeypatch.setattr(scrapper, "fetch_diary_page", fail_page_3_once)
+
+    result = run(tmp_path, scrapper.crawl, "someone", 4)
+    assert result.missing_pages == [3]
+
+    # A checkpointed page that cannot be read back is fetched again
+    checkpoint = CrawlCheckpoint("someone")
+    with open(checkpoint._page_path(2), "r+b") as file:
+        file.truncate(100)
+
+    result = run(tmp_path, scrapper.crawl, "someone", 4)
+    assert result.complete
+    assert len(result.df) == 4 * replay.config.films_per_page
+    assert not os.path.exists(checkpoint.directory)
+
+
+def test_incremental_sync_appends_new_entries_once(tmp_path, replay):
+    def crawl_user_with(cache, scheduler, client, executor):
+        return crawl_user("someone", client, cache, scheduler, executor, incremental=True)
+
+    report = run(tmp_path, crawl_user_with)
+    assert report["status"] == "ok"
+    diary = load_diary("someone")
+
+    # The stored diary misses the 5 newest entries, logged since the last crawl
+    save_diary("someone", diary.iloc[5:])
+
+    report = run(tmp_path, crawl_user_with)
+    assert report["status"] == "ok"
+    assert report["new_entries"] == 5
+
+    synced = load_diary("someone")
+    assert len(synced) == len(diary)
+    assert not scrapper._entry_keys(synced).duplicated().any()
+    assert list(synced["url"]) == list(diary["url"])
+
+    report = run(tmp_path, crawl_user_with)
+    assert report["new_entries"] == 0
+    assert len(load_diary("someone")) == len(diary)
+
+
+async def diary_without_details(cache, scheduler, client, executor) -> pd.DataFrame:
+    pages = [result.df async for result in scrapper.stream_main(
+        "someone", 2, cache, scheduler, client, executor, film_details=False)]
+    return scrapper.apply_schema(pd.concat(pages, ignore_index=True))
+
+
+def test_enrich_keeps_entries_without_rating(tmp_path, replay):
+    async def enrich(cache, scheduler, client, executor):
+        diary = await diary_without_details(cache, scheduler, client, executor)
+        diary.loc[0, "rating"] = float("nan")
+
+        results = [result async for result in scrapper.enrich_stream(
+            diary, cache, scheduler, client, executor, chunk_size=10)]
+        return diary, results
+
+    diary, results = run(tmp_path, enrich)
+    enriched = pd.concat([result.df for result in results], ignore_index=True)
+    assert list(enriched["url"]) == list(diary["url"])
+    assert not any(result.missing_films for result in results)
+
+
+def test_enrich_stopped_early_leaves_no_fetch_running(tmp_path, replay):
+    async def enrich_first_chunk(cache, scheduler, client, executor):
+        diary = await diary_without_details(cache, scheduler, client, executor)
+
+        enrich = scrapper.enrich_stream(diary, cache, scheduler, client, executor, chunk_size=10)
+        await anext(enrich)
+        await enrich.aclose()
+        return [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+
+    assert run(tmp_path, enrich_first_chunk) == []
@@ -0,0 +1,26 @@
+from concurrent.futures import ThreadPoolExecutor
+from http_cache import CachingTransport
+import httpx
+import os
+
+
+def test_concurrent_stores_of_the_same_response(tmp_path):
+    cache = CachingTransport(httpx.AsyncHTTPTransport(), str(tmp_path))
+    path = cache._path(httpx.URL("https://letterboxd.com/film/alien/"))
+    meta = {"status_code": 200, "headers": [], "stored_at": 0.0}
+
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(lambda i: cache._store(path, meta, b"<html>%d</html>" % i), range(64)))
+
+    assert cache._load(path) is not None
+    assert not [name for name in os.listdir(os.path.dirname(path)) if name.endswith(".tmp")]
+
+
+def test_truncated_response_is_a_miss(tmp_path):
+    cache = CachingTransport(httpx.AsyncHTTPTransport(), str(tmp_path))
+    path = cache._path(httpx.URL("https://letterboxd.com/film/alien/"))
+    cache._store(path, {"status_code": 200, "headers": [], "stored_at": 0.0}, b"<html>" * 1000)
+    with open(f"{path}.gz", "r+b") as file:
+        file.truncate(os.path.getsize(f"{path}.gz") // 2)
+
+    assert cache._load(path) is None
@@ -0,0 +1,70 @@
+import pandas as pd
+import pytest
+import storage
+import os
+
+
+CSV_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "letterboxd.csv")
+
+
+@pytest.fixture
+def diary() -> pd.DataFrame:
+    return storage.load_csv(CSV_PATH)
+
+
+def assert_same_diary(left: pd.DataFrame, right: pd.DataFrame) -> None:
+    # Categories come back in the order they are met in the file
+    pd.testing.assert_frame_equal(left.reset_index(drop=True), right.reset_index(drop=True),
+                                  check_categorical=False)
+
+
+def test_save_load_append_load(diary):
+    older, newer = diary.iloc[10:], diary.iloc[:10]
+
+    storage.save_diary("someone", older)
+    assert_same_diary(storage.load_diary("someone"), older)
+
+    storage.append_diary("someone", newer)
+    loaded = storage.load_diary("someone")
+    assert_same_diary(loaded, diary)
+    assert loaded.dtypes.equals(diary.dtypes)
+
+
+def test_load_missing_diary():
+    assert storage.load_diary("nobody") is None
+
+
+@pytest.mark.parametrize("username", ["../someone", "some/one", "", "some one"])
+def test_invalid_username(username):
+    with pytest.raises(ValueError):
+        storage.diary_dir(username)
+    with pytest.raises(ValueError):
+        storage.CrawlCheckpoint(username)
+
+
+def test_checkpoint_resumes_saved_pages(diary):
+    checkpoint = storage.CrawlCheckpoint("someone")
+    assert checkpoint.start(3, "newest") == set()
+    checkpoint.save_page(2, diary.iloc[:10])
+
+    assert storage.CrawlCheckpoint("someone").start(3, "newest") == {2}
+    assert_same_diary(checkpoint.load_page(2), diary.iloc[:10])
+
+
+def test_checkpoint_dropped_when_diary_changed(diary):
+    checkpoint = storage.CrawlCheckpoint("someone")
+    checkpoint.start(3, "newest")
+    checkpoint.save_page(2, diary.iloc[:10])
+
+    assert checkpoint.start(3, "newer") == set()
+    assert checkpoint.load_page(2) is None
+
+
+def test_checkpoint_unreadable_page(diary):
+    checkpoint = storage.CrawlCheckpoint("someone")
+    checkpoint.start(3, "newest")
+    checkpoint.save_page(2, diary.iloc[:10])
+    with open(checkpoint._page_path(2), "r+b") as file:
+        file.truncate(100)
+
+    assert checkpoint.load_page(2) is None
@@ -1,17 +1,25 @@
 import pandas as pd
 import streamlit as st
+from stats import ProfileStats
 
+# Caches a function of the profile statistics by their dataset key: the statistics themselves
+# are never hashed, and a new fetch of the diary gets a new key
+cache_by_dataset = st.cache_data(hash_funcs={ProfileStats: lambda stats: stats.key}, max_entries=64)
 
-@st.cache_data
-def compute_df_by_filter(df: pd.DataFrame, filter_column: str) -> pd.DataFrame:
+# Columns the diary can be summarised by, and the counts of the profile statistics holding them
+FILTER_COLUMNS = {
+    "Country": "country_counts",
+    "Language": "language_counts",
+    "Genres": "genre_counts",
+    "Actors": "actor_counts",
+    "Director": "director_counts",
+    "Studio": "studio_counts",
+}
 
-    filter = filter_column.lower().replace(" ", "_")
 
-    if filter_column in ["Country", "Language"]:
-        df_filtered = df[filter].value_counts().reset_index()
-        df_filtered.columns = [filter_column, "Count"]
-        return df_filtered
-    else:
-        df_filtered = df[filter].explode().value_counts().reset_index()
-        df_filtered.columns = [filter_column, "Count"]
-        return df_filtered
+@cache_by_dataset
+def compute_df_by_filter(stats: ProfileStats, filter_column: str) -> pd.DataFrame:
+
+    df_filtered = getattr(stats, FILTER_COLUMNS[filter_column]).reset_index()
+    df_filtered.columns = [filter_column, "Count"]
+    return df_filtered
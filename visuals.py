@@ -1,16 +1,15 @@
 import matplotlib.patches as patches
-import pandas as pd
-import numpy as np
 import plotly.graph_objects as go
 import matplotlib.pyplot as plt
+from stats import ProfileStats, mode
 
 
-def draw_top3(df: pd.DataFrame) -> plt.Figure:
+def draw_top3(stats: ProfileStats) -> plt.Figure:
     """ Draw a pie chart showing the favorite director, actor, and total films logged."""
 
-    total_films = df.shape[0]
-    favorite_director = df['director'].mode().values[0]
-    favorite_actor = df['actors'].explode().mode().values[0]
+    total_films = stats.total_films
+    favorite_director = mode(stats.director_counts)
+    favorite_actor = mode(stats.actor_counts)
 
     if len(favorite_director) > 13:
         favorite_director = "\n"+favorite_director.replace(" ", "\n")
@@ -52,18 +51,17 @@ def draw_top3(df: pd.DataFrame) -> plt.Figure:
 
     ax.set_aspect('equal')
 
-    plt.xlim(0.25, 3.5)
-    plt.ylim(0, 2)
-    plt.axis('off')
+    ax.set_xlim(0.25, 3.5)
+    ax.set_ylim(0, 2)
+    ax.axis('off')
 
     return fig
 
 
-def draw_top_countries(df: pd.DataFrame) -> go.Figure:
+def draw_top_countries(stats: ProfileStats) -> go.Figure:
     """ Draw a horizontal bar chart showing the top 5 countries with the most films logged."""
 
-    top_countries = df['country'].value_counts(
-    ).sort_values(ascending=True).tail(5)
+    top_countries = stats.country_counts.sort_values(ascending=True).tail(5)
 
     colors = ['#FF8000', '#00E054', '#40BCF4', "#272F36"]
 
@@ -116,15 +114,11 @@ def draw_top_countries(df: pd.DataFrame) -> go.Figure:
     return remove_plotly_menus(fig)
 
 
-def draw_log_timeline(df: pd.DataFrame) -> go.Figure:
+def draw_log_timeline(stats: ProfileStats) -> go.Figure:
     """ Draw a bar chart showing the number of films logged over time since the user started logging."""
 
     colors = ['#FF8000', '#00E054', '#40BCF4', "#272F36"]
-    df['log_date'] = pd.to_datetime(df['log_date'])
-    df['year_month'] = df['log_date'].dt.to_period('M').astype(str)
-
-    log_counts = df.groupby(
-        ['year_month']).size().reset_index(name='counts')
+    log_counts = stats.monthly_log_counts
 
     fig = go.Figure(data=[
         go.Bar(
@@ -166,11 +160,11 @@ def draw_log_timeline(df: pd.DataFrame) -> go.Figure:
     return remove_plotly_menus(fig)
 
 
-def draw_top_genres(df: pd.DataFrame) -> go.Figure:
+def draw_top_genres(stats: ProfileStats) -> go.Figure:
     """ Draw a treemap showing the top 10 genres of films logged."""
 
     colors = ['#FF8000', '#00E054', '#40BCF4', "#272F36"]
-    genres = df['genres'].explode().value_counts().nlargest(10)
+    genres = stats.genre_counts.nlargest(10)
 
     # Create the treemap figure using go.Treemap
     fig = go.Figure(go.Treemap(
@@ -198,18 +192,13 @@ def draw_top_genres(df: pd.DataFrame) -> go.Figure:
     return remove_plotly_menus(fig)
 
 
-def draw_rating_dist(df: pd.DataFrame) -> go.Figure:
+def draw_rating_dist(stats: ProfileStats) -> go.Figure:
     """ Draw a bar chart showing the distribution of film ratings."""
 
-    df['rating'] = df['rating'].astype(float) / 2
-
-    # Define the bins and labels
-    bins = [0.5, 1, 1.5, 2, 2.5, 3, 3.5, 4, 4.5, 5, 5.5]
+    # Labels of the bins of the histogram (see RATING_BINS)
     bin_labels = ["0.5", "1", "1.5", "2",
                   "2.5", "3", "3.5", "4", "4.5", "5"]
-
-    # Compute the histogram
-    hist, _ = np.histogram(df['rating'], bins=bins)
+    hist = stats.rating_histogram
 
     # Create the bar plot
     fig = go.Figure()
@@ -259,11 +248,11 @@ def draw_rating_dist(df: pd.DataFrame) -> go.Figure:
     return remove_plotly_menus(fig)
 
 
-def draw_top_actors(df: pd.DataFrame) -> go.Figure:
+def draw_top_actors(stats: ProfileStats) -> go.Figure:
     """ Draw a treemap showing the top 10 actors of films logged."""
 
     colors = ['#FF8000', '#00E054', '#40BCF4', "#272F36"]
-    actors = df['actors'].explode().value_counts().nlargest(10)
+    actors = stats.actor_counts.nlargest(10)
 
     # Create the treemap figure using go.Treemap
     fig = go.Figure(go.Treemap(
@@ -6,11 +6,10 @@ import matplotlib as mpl
 from matplotlib.colors import LinearSegmentedColormap
 from mpl_toolkits.axes_grid1.inset_locator import inset_axes
 from textwrap import wrap
-import streamlit as st
+from stats import ProfileStats
 
 
-@st.cache_data
-def draw_studios_radar(df) -> plt.Figure:
+def draw_studios_radar(stats: ProfileStats) -> plt.Figure:
     """ Draw a radar chart showing the favorite studios of films logged.
         Legend :
         - The size of the bars represents the average of the ratings given by the user for the movies from each studio.
@@ -18,11 +17,10 @@ def draw_studios_radar(df) -> plt.Figure:
         - The color gradient represents the number of movies the user has watched from each studio.
     """
 
-    studios = df['studio'].value_counts().nlargest(10)
-    studio_ratings = df.groupby('studio')['rating'].mean().loc[studios.index]
-    studio_counts = df['studio'].value_counts().loc[studios.index]
-    studio_avg_ratings = df.groupby(
-        'studio')['average_rating'].mean().loc[studios.index]
+    studios = stats.studio_counts.nlargest(10)
+    studio_ratings = stats.studio_ratings['rating'].loc[studios.index]
+    studio_counts = stats.studio_counts.loc[studios.index]
+    studio_avg_ratings = stats.studio_ratings['avg_rating'].loc[studios.index]
 
     df_studios = pd.DataFrame(
         {'rating': studio_ratings, 'counts': studio_counts, 'avg_rating': studio_avg_ratings})
@@ -135,13 +133,10 @@ def draw_studios_radar(df) -> plt.Figure:
     return fig, title, subtitle
 
 
-@st.cache_data
-def draw_decades_radar(df) -> plt.Figure:
+def draw_decades_radar(stats: ProfileStats) -> plt.Figure:
     """ Draw a radar chart showing the favorite decades of films logged. (Top 8)"""
 
-    df["decade"] = df["date"] // 10 * 10
-
-    decade_counts = df["decade"].value_counts().sort_index().nlargest(8)
+    decade_counts = stats.decade_counts.nlargest(8)
     YEARS = decade_counts.index.tolist()
     MOVIES_N = decade_counts.values.tolist()
 
@@ -188,84 +183,94 @@ def draw_decades_radar(df) -> plt.Figure:
     return fig, title, subtitle
 
 
-@st.cache_data
-def draw_lang_sankey(df) -> go.Figure:
+# Colours of the languages, in order of appearance in the Sankey diagram (grey past the last one)
+LANGUAGE_COLORS = [
+    (0, 128, 0),      # green
+    (255, 0, 0),      # red
+    (255, 165, 0),    # orange
+    (128, 0, 128),    # purple
+    (0, 255, 255),    # cyan
+    (255, 0, 255),    # magenta
+    (255, 255, 0),    # yellow
+    (128, 128, 128),  # gray
+    (0, 100, 0),      # dark green
+    (255, 20, 147),   # deep pink
+    (75, 0, 130),     # indigo
+    (255, 69, 0),     # orange red
+    (139, 0, 139),    # dark magenta
+    (255, 105, 180),  # hot pink
+    (0, 255, 127),    # spring green
+    (255, 140, 0),    # dark orange
+    (85, 107, 47),    # dark olive green
+    (255, 182, 193),  # light pink
+    (46, 139, 87),    # sea green
+    (255, 215, 0),    # gold
+    (0, 206, 209),    # dark turquoise
+    (147, 112, 219),  # medium purple
+]
+
+# Countries and languages kept in the Sankey diagram, the others are collapsed into a single node
+SANKEY_MAX_COUNTRIES = 20
+SANKEY_MAX_LANGUAGES = 20
+OTHER_COUNTRIES = "Other countries"
+OTHER_LANGUAGES = "Other languages"
+
+
+def _collapse_long_tail(names: pd.Series, counts: pd.Series, keep: int | None, other: str) -> pd.Series:
+    """ Replace the names beyond the keep most frequent ones by other """
+    totals = counts.groupby(names.to_numpy(), sort=False).sum()
+    if keep is None or len(totals) <= keep:
+        return names
+    return names.where(names.isin(totals.nlargest(keep).index), other)
+
+
+def _nodes(names: pd.Index, other: str) -> pd.Categorical:
+    """ Nodes in order of appearance, the collapsed node last """
+    order = [name for name in pd.unique(names) if name != other]
+    if len(order) < names.nunique():
+        order.append(other)
+    return pd.Categorical(names, categories=order)
+
+
+def _colors(codes: np.ndarray, is_other: np.ndarray, alpha: float) -> np.ndarray:
+    """ RGBA colour of each language code, grey for the collapsed node and past the palette """
+    palette = np.array([f"rgba({r}, {g}, {b}, {alpha})" for r, g, b in LANGUAGE_COLORS] + ["grey"])
+    return palette[np.where(is_other, len(LANGUAGE_COLORS), np.minimum(codes, len(LANGUAGE_COLORS)))]
+
+
+def draw_lang_sankey(stats: ProfileStats, max_countries: int | None = SANKEY_MAX_COUNTRIES,
+                     max_languages: int | None = SANKEY_MAX_LANGUAGES) -> go.Figure:
     """ Create a Sankey diagram showing the distribution of languages spoken in the movies 
         the user has watched by the country of origin of the movies. 
+        Countries and languages past the max_countries and max_languages most frequent ones are
+        collapsed into an "Other" node (None keeps them all).
     """
 
-    df = df[["country", "primary_language"]]
-
-    link_counts = df.groupby(
-        ['country', 'primary_language']).size().reset_index(name='count')
-
-    countries = link_counts['country'].unique()
-    languages = link_counts['primary_language'].unique()
-
-    # Create a mapping of the nodes to their indices : {node_name: node_index}
-    node_mapping = {name: idx for idx, name in enumerate(
-        list(countries) + list(languages))}
-
-    # Create a list of sources, targets, and values for the Sankey diagram
-    sources = [node_mapping[country] for country in link_counts['country']]
-    targets = [node_mapping[language]
-               for language in link_counts['primary_language']]
-    values = link_counts['count']
-
-    language_colors = {
-        language: color for language, color in zip(
-            languages,
-            [
-                'rgba(0, 128, 0, 1)',    # green
-                'rgba(255, 0, 0, 1)',    # red
-                'rgba(255, 165, 0, 1)',  # orange
-                'rgba(128, 0, 128, 1)',  # purple
-                'rgba(0, 255, 255, 1)',  # cyan
-                'rgba(255, 0, 255, 1)',  # magenta
-                'rgba(255, 255, 0, 1)',  # yellow
-                'rgba(128, 128, 128, 1)',  # gray
-                'rgba(0, 100, 0, 1)',    # dark green
-                'rgba(255, 20, 147, 1)',  # deep pink
-                'rgba(75, 0, 130, 1)',   # indigo
-                'rgba(255, 69, 0, 1)',   # orange red
-                'rgba(139, 0, 139, 1)',  # dark magenta
-                'rgba(255, 105, 180, 1)',  # hot pink
-                'rgba(0, 255, 127, 1)',  # spring green
-                'rgba(255, 140, 0, 1)',  # dark orange
-                'rgba(85, 107, 47, 1)',  # dark olive green
-                'rgba(255, 182, 193, 1)',  # light pink
-                'rgba(46, 139, 87, 1)',  # sea green
-                'rgba(255, 215, 0, 1)',  # gold
-                'rgba(0, 206, 209, 1)',  # dark turquoise
-                'rgba(147, 112, 219, 1)'  # medium purple
-            ]
-        )
-    }
-
-    # Créer une liste de couleurs pour les noeuds
-    node_colors = ['grey' for _ in range(len(countries) + len(languages))]
-    for language, idx in node_mapping.items():
-        if language in language_colors:
-            node_colors[idx] = language_colors[language]
-
-    # Créer une liste de couleurs pour les liens avec une opacité de 0.4
-    link_colors = []
-    for target in targets:
-        base_color = node_colors[target]
-        rgba_color = base_color.replace(
-            '1)', '0.4)')  # Changer l'opacité à 0.4
-        link_colors.append(rgba_color)
-
-    # Attribuer la couleur du lien avec le poids le plus grand à la source
-    for country in countries:
-        outgoing_indices = [i for i in range(
-            len(sources)) if sources[i] == node_mapping[country]]
-        if outgoing_indices:
-            # Trouver l'indice du lien avec le poids maximum
-            max_index = max(outgoing_indices, key=lambda i: values[i])
-            # Utiliser la couleur de la target du lien avec le poids maximum pour la source
-            node_colors[node_mapping[country]
-                        ] = link_colors[max_index].replace('0.4)', '1)')
+    link_counts = stats.country_language_links
+    counts = link_counts['count']
+    countries = _collapse_long_tail(link_counts['country'], counts, max_countries, OTHER_COUNTRIES)
+    languages = _collapse_long_tail(link_counts['primary_language'], counts, max_languages, OTHER_LANGUAGES)
+
+    links = counts.groupby([countries.to_numpy(), languages.to_numpy()], sort=False).sum()
+    countries = _nodes(links.index.get_level_values(0), OTHER_COUNTRIES)
+    languages = _nodes(links.index.get_level_values(1), OTHER_LANGUAGES)
+
+    # Nodes are the countries followed by the languages
+    sources = countries.codes.astype(int)
+    targets = languages.codes.astype(int) + len(countries.categories)
+    values = links.to_numpy()
+
+    # The links take the colour of their language, and each country the colour of its heaviest link
+    language_codes = np.arange(len(languages.categories))
+    is_other_language = np.asarray(languages.categories == OTHER_LANGUAGES)
+    language_colors = _colors(language_codes, is_other_language, 1)
+    link_colors = _colors(languages.codes, is_other_language[languages.codes], 0.4)
+
+    heaviest = pd.Series(values).groupby(sources).idxmax().to_numpy()
+    country_colors = language_colors[languages.codes[heaviest]]
+
+    node_labels = list(countries.categories) + list(languages.categories)
+    node_colors = country_colors.tolist() + language_colors.tolist()
 
     # Créer le diagramme de Sankey
     fig = go.Figure(data=[go.Sankey(
@@ -273,7 +278,7 @@ def draw_lang_sankey(df) -> go.Figure:
             pad=200,  # Augmenter l'espace entre les nœuds
             thickness=50,  # Augmenter l'épaisseur des nœuds
             line=dict(color='black', width=0.5),
-            label=list(countries) + list(languages),
+            label=node_labels,
             color=node_colors
         ),
         link=dict(
@@ -301,7 +306,10 @@ def draw_lang_sankey(df) -> go.Figure:
 
 
 if __name__ == "__main__":
+    from storage import load_csv
+
+    from stats import compute_profile_stats, dataset_key
 
-    df = pd.read_csv('letterboxd.csv')
-    fig = draw_lang_sankey(df)
+    df = load_csv('letterboxd.csv')
+    fig, _, _ = draw_lang_sankey(compute_profile_stats(df, dataset_key("letterboxd", df)))
     fig.show()